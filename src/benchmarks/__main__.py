@@ -0,0 +1,85 @@
+"""Microbenchmarks for the parse, diff and serialisation hot paths.
+
+    python -m benchmarks [-o results.json] [--compare baseline.json] [--fixtures DIR]
+
+Results are written as JSON. With ``--compare``, exits non-zero if any
+benchmark's median is slower than the baseline by more than ``--threshold``.
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import timeit
+from typing import Any, Callable, Mapping, MutableMapping
+
+from . import hot_paths
+
+
+def measure(func: Callable[[], object], repeat: int) -> Mapping[str, Any]:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    timings = [t / number for t in timer.repeat(repeat, number)]
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def compare(results: Mapping[str, Mapping[str, Any]], baseline: Mapping[str, Mapping[str, Any]],
+        threshold: float) -> MutableMapping[str, float]:
+    regressions = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        if ratio > threshold:
+            regressions[name] = ratio
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the evcharge_status microbenchmarks.')
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default='-')
+    parser.add_argument('-k', '--filter', help='Only run benchmarks whose name contains this.')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--parser', default='bs4', help='Parser backend to benchmark.')
+    parser.add_argument('--fixtures', help='Directory of recorded *.html / *.json fixtures to use instead of benchmarks/recorded.')
+    parser.add_argument('--compare', type=argparse.FileType('r'), help='Baseline results to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+        help='Maximum allowed slowdown ratio against the baseline.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, func in hot_paths.cases(args.fixtures, args.parser):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat)
+        print(f'{name}: {results[name]["median"] * 1e6:.1f}us', file=sys.stderr)
+
+    json.dump({
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parser': args.parser,
+        'results': results,
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+    if args.compare:
+        regressions = compare(results, json.load(args.compare)['results'], args.threshold)
+        for name, ratio in sorted(regressions.items()):
+            print(f'REGRESSION {name}: {ratio:.2f}x baseline', file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""nologinpoints / nologinsites fixtures for the benchmarks.
+
+Recorded responses are read from ``RECORDED_DIR``, or another directory given
+to ``--fixtures``: ``*.html`` files are treated as nologinpoints pages and
+``*.json`` files as nologinsites responses. Synthetic ones of increasing size
+are added to show how each path scales.
+"""
+from decimal import Decimal
+import glob
+import json
+import os
+import random
+from typing import Any, Mapping, MutableMapping, Tuple
+
+from evcharge_status.models import ConnectorType, Point, Site, State
+
+
+RECORDED_DIR = os.path.join(os.path.dirname(__file__), 'recorded')
+
+POINT_SIZES = (1, 10, 100)
+SITE_SIZES = (1, 10, 100)
+
+POINT_ROW = '''
+<tr class="charge-point-row" onclick="showPointDetails('{point_id}', '{guid}', '{max_power}', '{price}', '1', 'False' )">
+  <td>
+    <div class="charg-list site-details">
+      <div class="chrge-site-img"><img src="/Content/images/connectors/{image}.png" alt="" /></div>
+      <div class="chrge-info">
+        <span class="total-energy-icon"></span><span class="chrge-left">
+          {connector_type}
+        </span>
+      </div>
+      <div class="chrge-status">
+        <button type="button" class="btn btn-status">
+          {state}
+        </button>
+      </div>
+    </div>
+  </td>
+</tr>'''
+
+POINTS_PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+  <base href="https://evcharge.online/" />
+  <title>EVCharge.online</title>
+</head>
+<body>
+  <div class="container">
+    <table class="table charge-points">
+{rows}
+    </table>
+  </div>
+</body>
+</html>'''
+
+
+def _guid(rng: random.Random) -> str:
+    return ''.join(rng.choice('0123456789ABCDEF') for _ in range(96))
+
+
+def points_page(point_count: int, seed: int=0) -> bytes:
+    rng = random.Random(seed)
+    connector_types = [c for c in ConnectorType if c is not ConnectorType.UNKNOWN]
+    rows = []
+    for i in range(point_count):
+        connector_type = rng.choice(connector_types)
+        rows.append(POINT_ROW.format(
+            point_id=f'UKEV{1000 + i}',
+            guid=_guid(rng),
+            max_power=rng.choice(('7', '22', '50', '150')),
+            price=rng.choice(('0.1800', '0.2500', '0.3000', '0.4500')),
+            image=connector_type.name.lower(),
+            connector_type=connector_type.value,
+            state=rng.choice(list(State)).value,
+        ))
+    return POINTS_PAGE.format(rows=''.join(rows)).encode('utf-8')
+
+
+def sites_response(site_count: int, seed: int=0) -> Mapping[str, Any]:
+    rng = random.Random(seed)
+    return {
+        'MessagePoint': None,
+        'objSites': [
+            {
+                'RefGuid': _guid(rng),
+                'SiteName': f'Site {i}',
+                'Address': f'{i} High Street',
+                'Town': 'Banbury',
+                'County': 'Oxfordshire',
+                'Postcode': 'OX16 1AA',
+                'Country': 'United Kingdom',
+                'Latitude': f'{52 + rng.random():.5f}',
+                'Longitude': f'{-1 - rng.random():.5f}',
+            }
+            for i in range(site_count)
+        ],
+    }
+
+
+def site(point_count: int, seed: int=0) -> Site:
+    rng = random.Random(seed)
+    connector_types = [c for c in ConnectorType if c is not ConnectorType.UNKNOWN]
+    points: MutableMapping[str, Point] = {}
+    for i in range(point_count):
+        guid = _guid(rng)
+        points[guid] = Point(
+            guid,
+            f'UKEV{1000 + i}',
+            rng.choice(list(State)),
+            Decimal(rng.choice(('0.18', '0.25', '0.3', '0.45'))),
+            float(rng.choice((7, 22, 50, 150))),
+            rng.choice(connector_types),
+            'https://evcharge.online/Content/images/connectors/type_2.png',
+        )
+    return Site(
+        _guid(rng), f'Site with {point_count} points', '1 High Street', 'Banbury', 'Oxfordshire',
+        'OX16 1AA', 'United Kingdom', '52.06290', '-1.33978', points,
+    )
+
+
+def changed_site(original: Site, changed_points: int, seed: int=1) -> Site:
+    """A copy of ``original`` with the state of ``changed_points`` points flipped."""
+    rng = random.Random(seed)
+    states = list(State)
+    points = {}
+    for i, (guid, point) in enumerate(original.points.items()):
+        state = point.state
+        if i < changed_points:
+            state = rng.choice([s for s in states if s is not point.state])
+        points[guid] = Point(guid, point.point_id, state, point.price, point.max_power,
+            point.connector_type, point.image_url)
+    copy = original.copy()
+    copy._points = points
+    return copy
+
+
+def recorded(directory: str=RECORDED_DIR) -> Tuple[Mapping[str, bytes], Mapping[str, Mapping[str, Any]]]:
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, 'rb') as fh:
+            pages[os.path.basename(path)] = fh.read()
+    searches = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, 'rb') as fh:
+            searches[os.path.basename(path)] = json.load(fh)
+    return pages, searches
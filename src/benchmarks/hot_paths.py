@@ -0,0 +1,62 @@
+from typing import Callable, Iterator, Optional, Tuple
+
+from evcharge_status.models import SiteDiff
+from evcharge_status.scraper import EVCharge
+from evcharge_status.stores.file import Store as FileStore
+
+from . import fixtures
+
+
+BASE_URL = 'https://evcharge.online/nologinpoints/'
+
+Case = Tuple[str, Callable[[], object]]
+
+
+def _parse_cases(evcharge: EVCharge, pages) -> Iterator[Case]:
+    for name, content in pages:
+        yield f'parse_site_points[{name}]', lambda content=content: evcharge.parse_site_points(content, BASE_URL)
+
+
+def _site_cases(name: str, site, changed) -> Iterator[Case]:
+    unchanged = fixtures.changed_site(site, 0)
+    yield f'SiteDiff.from_sites[{name},unchanged]', lambda: SiteDiff.from_sites(site, unchanged)
+    yield f'SiteDiff.from_sites[{name},changed]', lambda: SiteDiff.from_sites(site, changed)
+    yield f'Site.copy[{name}]', site.copy
+
+    file_item = FileStore.format_site(site)
+    yield f'file.format_site[{name}]', lambda: FileStore.format_site(site)
+    yield f'file.parse_site[{name}]', lambda: FileStore.parse_site(file_item)
+
+    try:
+        from evcharge_status.stores.dynamodb import Store as DynamoDBStore
+    except ImportError:
+        pass
+    else:
+        dynamodb_item = DynamoDBStore.format_site(site)
+        yield f'dynamodb.format_site[{name}]', lambda: DynamoDBStore.format_site(site)
+        yield f'dynamodb.parse_site[{name}]', lambda: DynamoDBStore.parse_site(dynamodb_item)
+
+    try:
+        from evcharge_status.notifications.slack import Notifier as SlackNotifier
+    except ImportError:
+        pass
+    else:
+        yield f'slack.build_message[{name}]', lambda: SlackNotifier.build_message(
+            site, 'Current status', with_price=True, with_connector_type=True, with_max_power=True)
+
+
+def cases(fixtures_dir: Optional[str]=None, parser: str='bs4') -> Iterator[Case]:
+    evcharge = EVCharge(parser)
+
+    recorded_pages, recorded_searches = fixtures.recorded(fixtures_dir or fixtures.RECORDED_DIR)
+    pages = [*recorded_pages.items(), *((f'{n}_points', fixtures.points_page(n)) for n in fixtures.POINT_SIZES)]
+    searches = [*recorded_searches.items(), *((f'{n}_sites', fixtures.sites_response(n)) for n in fixtures.SITE_SIZES)]
+
+    yield from _parse_cases(evcharge, pages)
+    for name, data in searches:
+        yield f'parse_sites[{name}]', lambda data=data: evcharge.parse_sites(data)
+
+    for n in fixtures.POINT_SIZES:
+        site = fixtures.site(n)
+        changed = fixtures.changed_site(site, max(1, n // 10))
+        yield from _site_cases(f'{n}_points', site, changed)
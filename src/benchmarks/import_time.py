@@ -0,0 +1,115 @@
+"""Start up cost of the entry points, from ``python -X importtime``.
+
+    python -m benchmarks.import_time [-o results.json] [--compare baseline.json]
+
+Each module is imported in a fresh interpreter ``--repeat`` times. Results are
+written as JSON in the same shape as ``python -m benchmarks``, in seconds. With
+``--compare``, exits non-zero if any module is slower to import than the
+baseline by more than ``--threshold``, or with ``--limit``, slower than that
+many milliseconds.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from typing import Any, List, Mapping, Tuple
+
+from .__main__ import compare
+
+
+MODULES = (
+    'evcharge_status.cli',
+    'evcharge_status.aws_lambda',
+    'evcharge_status.stores.dynamodb',
+)
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """(module, self, cumulative) in microseconds, for each line of
+    ``-X importtime`` output."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            # the header
+            continue
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def import_time(module: str) -> List[Tuple[str, int, int]]:
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SOURCE_DIR, capture_output=True, text=True, check=True)
+    return parse_importtime(process.stderr)
+
+
+def measure(module: str, repeat: int) -> Mapping[str, Any]:
+    timings = []
+    for _ in range(repeat):
+        imports = import_time(module)
+        timings.append(next(cumulative for name, _, cumulative in imports if name == module) / 1e6)
+    heaviest = sorted(imports, key=lambda i: i[1], reverse=True)[:5]
+    return {
+        'number': 1,
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'modules': len(imports),
+        'heaviest': [name for name, _, _ in heaviest],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import time of the evcharge_status entry points.')
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default='-')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--compare', type=argparse.FileType('r'), help='Baseline results to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+        help='Maximum allowed slowdown ratio against the baseline.')
+    parser.add_argument('--limit', type=float, help='Maximum allowed import time of any module in milliseconds.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for module in MODULES:
+        results[module] = measure(module, args.repeat)
+        print(
+            f'{module}: {results[module]["median"] * 1e3:.1f}ms, '
+            f'{results[module]["modules"]} modules, heaviest {", ".join(results[module]["heaviest"])}',
+            file=sys.stderr)
+
+    json.dump({
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+    failed = False
+    if args.compare:
+        regressions = compare(results, json.load(args.compare)['results'], args.threshold)
+        for name, ratio in sorted(regressions.items()):
+            print(f'REGRESSION {name}: {ratio:.2f}x baseline', file=sys.stderr)
+            failed = True
+    if args.limit is not None:
+        for name, result in sorted(results.items()):
+            if result['median'] * 1e3 > args.limit:
+                print(f'REGRESSION {name}: {result["median"] * 1e3:.1f}ms, limit {args.limit}ms', file=sys.stderr)
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
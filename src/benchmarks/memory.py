@@ -0,0 +1,112 @@
+"""Memory held by parsed sites, as when watching a large fleet.
+
+    python -m benchmarks.memory [-o results.json] [--compare baseline.json]
+
+Sites are built the way the watcher gets them: details from a nologinsites
+response and points parsed from nologinpoints pages, plus the copy taken of
+each site every cycle. Results are written as JSON in the same shape as
+``python -m benchmarks``, in bytes per site. With ``--compare``, exits
+non-zero if any result is larger than the baseline by more than
+``--threshold``.
+"""
+import argparse
+import datetime
+import gc
+import json
+import platform
+import sys
+import tracemalloc
+from typing import Any, Callable, List, Mapping, Sequence
+
+from evcharge_status.models import Point, Site
+from evcharge_status.parsers import get_parser
+
+from . import fixtures
+from .__main__ import compare
+
+
+SITE_COUNTS = (1000, 10000)
+POINTS_PER_SITE = 4
+
+BASE_URL = 'https://evcharge.online/nologinpoints/'
+
+
+def build_sites(response: Mapping[str, Any], pages: Sequence[bytes],
+        parse_site_points: Callable[[bytes, str], Mapping[str, Point]]) -> List[Site]:
+    return [
+        Site(
+            data['RefGuid'], data['SiteName'], data['Address'], data['Town'], data['County'],
+            data['Postcode'], data['Country'], data['Latitude'], data['Longitude'],
+            parse_site_points(page, BASE_URL),
+        )
+        for data, page in zip(response['objSites'], pages)
+    ]
+
+
+def measure(site_count: int, parser: str) -> Mapping[str, Any]:
+    # every point has its own GUID, as on the real site
+    response = fixtures.sites_response(site_count)
+    pages = [fixtures.points_page(POINTS_PER_SITE, seed) for seed in range(site_count)]
+    # json.loads would give fresh strings, not the fixtures' shared ones
+    response = json.loads(json.dumps(response))
+    parse_site_points = get_parser(parser)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        sites = build_sites(response, pages, parse_site_points)
+        # what the watcher holds on to during a cycle
+        copies = [site.copy() for site in sites]
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del sites, copies
+
+    held = current - before
+    return {
+        'sites': site_count,
+        'points_per_site': POINTS_PER_SITE,
+        'bytes': held,
+        'peak_bytes': peak - before,
+        # so the results can be compared like the timing benchmarks
+        'median': held / site_count,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure memory held by parsed sites.')
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default='-')
+    parser.add_argument('--parser', default='bs4', help='Parser backend used to build the points.')
+    parser.add_argument('--compare', type=argparse.FileType('r'), help='Baseline results to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.1,
+        help='Maximum allowed growth ratio against the baseline.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for site_count in SITE_COUNTS:
+        name = f'sites[{site_count}]'
+        results[name] = measure(site_count, args.parser)
+        print(f'{name}: {results[name]["median"]:.0f} bytes per site', file=sys.stderr)
+
+    json.dump({
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parser': args.parser,
+        'results': results,
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+    if args.compare:
+        regressions = compare(results, json.load(args.compare)['results'], args.threshold)
+        for name, ratio in sorted(regressions.items()):
+            print(f'REGRESSION {name}: {ratio:.2f}x baseline', file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,390 @@
+"""Utilisation of charge points, from a recorded ``History``.
+
+    python -m evcharge_status.analytics HISTORY_DIR [--start ISO] [--end ISO] [--connector-type CCS] [--json]
+
+For each point and each site, over the chosen period:
+
+* occupancy: the percentage of time charging, out of the time available or
+  charging,
+* the number of charging sessions, and their mean and percentile lengths,
+* minutes offline,
+* an hour of week heatmap of how much of the time each hour (UTC, Monday
+  first) the point was available.
+
+Needs NumPy (``pip install evcharge-status[analytics]``).
+"""
+import argparse
+import datetime
+import json
+import sys
+import time
+from typing import Any, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .history import ATTRIBUTE_CODES, CONNECTOR_TYPES, NO_VALUE, STATES, History
+from .models import ConnectorType, State
+
+
+DEFAULT_PERCENTILES = (50, 90)
+
+HOUR = 3600
+DAY = 24 * HOUR
+HOURS_PER_WEEK = 7 * 24
+# the epoch was a Thursday
+EPOCH_WEEKDAY = 3
+
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+CHARGING = STATE_CODES[State.CHARGING]
+AVAILABLE = STATE_CODES[State.AVAILABLE]
+OFFLINE = STATE_CODES[State.OFFLINE]
+UNKNOWN = STATE_CODES[State.UNKNOWN]
+
+# bound the size of the points x hours arrays built for heatmaps
+MAX_HEATMAP_CELLS = 2 ** 21
+
+
+class Utilisation(NamedTuple):
+    site_guid: str
+    point_guid: Optional[str]
+    connector_type: Optional[ConnectorType]
+    occupancy: float
+    sessions: int
+    session_mean: float
+    session_percentiles: Mapping[int, float]
+    offline_minutes: float
+    # 7 days x 24 hours, the fraction of observed time available
+    heatmap: np.ndarray
+
+
+class StateRuns(NamedTuple):
+    """Time spent by each point in each state, as parallel arrays sorted by
+    point then time, clipped to the period being analysed."""
+    point: np.ndarray
+    state: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+
+    @property
+    def duration(self) -> np.ndarray:
+        return self.end - self.start
+
+
+def _extract(columns: Mapping[str, memoryview], end: float) -> Tuple[np.ndarray, ...]:
+    # copies, so nothing refers to the mapped files once this returns
+    timestamps = np.asarray(columns['timestamp'])
+    count = int(np.searchsorted(timestamps, end, 'left'))
+    attributes = np.asarray(columns['attribute'])[:count]
+    is_state = attributes == ATTRIBUTE_CODES['state']
+    is_connector_type = attributes == ATTRIBUTE_CODES['connector_type']
+    sites = np.asarray(columns['site'])[:count]
+    points = np.asarray(columns['point'])[:count]
+    new = np.asarray(columns['new'])[:count]
+    return (
+        timestamps[:count][is_state], sites[is_state], points[is_state], new[is_state],
+        points[is_connector_type], new[is_connector_type],
+    )
+
+
+def state_runs(point_codes: np.ndarray, timestamps: np.ndarray, states: np.ndarray,
+        start: float, end: float) -> StateRuns:
+    """Each state transition starts a run which lasts until the point's next
+    transition, or ``end``."""
+    order = np.argsort(point_codes, kind='stable')
+    points = point_codes[order]
+    run_start = timestamps[order]
+    run_states = states[order]
+
+    run_end = np.empty_like(run_start)
+    run_end[:-1] = run_start[1:]
+    if len(run_end):
+        run_end[-1] = end
+    last_of_point = np.ones(len(points), dtype=bool)
+    last_of_point[:-1] = points[1:] != points[:-1]
+    run_end[last_of_point] = end
+
+    run_start = np.clip(run_start, start, end)
+    run_end = np.clip(run_end, start, end)
+    return StateRuns(points, run_states, run_start, run_end)
+
+
+def sessions(runs: StateRuns, state: int=CHARGING) -> Tuple[np.ndarray, np.ndarray]:
+    """(point, length) of each unbroken spell in ``state``. Repeated
+    observations of the same state are joined together."""
+    starts_spell = np.ones(len(runs.point), dtype=bool)
+    starts_spell[1:] = (runs.point[1:] != runs.point[:-1]) | (runs.state[1:] != runs.state[:-1])
+    spell = np.cumsum(starts_spell) - 1
+    lengths = np.bincount(spell, weights=runs.duration, minlength=int(starts_spell.sum()))
+    in_state = (runs.state[starts_spell] == state) & (lengths > 0)
+    return runs.point[starts_spell][in_state], lengths[in_state]
+
+
+def group_percentiles(groups: np.ndarray, values: np.ndarray, group_count: int,
+        percentiles: Sequence[int]) -> np.ndarray:
+    """Linearly interpolated percentiles of ``values`` within each group, as a
+    groups x percentiles array. NaN for empty groups."""
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    firsts = np.cumsum(counts) - counts
+    result = np.full((group_count, len(percentiles)), np.nan)
+    has_values = counts > 0
+    if not has_values.any():
+        return result
+
+    for i, percentile in enumerate(percentiles):
+        position = percentile / 100 * (counts[has_values] - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        low_values = sorted_values[firsts[has_values] + lower]
+        high_values = sorted_values[firsts[has_values] + upper]
+        result[has_values, i] = low_values + (high_values - low_values) * (position - lower)
+    return result
+
+
+def group_means(groups: np.ndarray, values: np.ndarray, group_count: int) -> np.ndarray:
+    counts = np.bincount(groups, minlength=group_count)
+    totals = np.bincount(groups, weights=values, minlength=group_count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return totals / counts
+
+
+def hour_of_week(timestamps: np.ndarray) -> np.ndarray:
+    days = timestamps // DAY
+    return (((days + EPOCH_WEEKDAY) % 7) * 24 + (timestamps // HOUR) % 24).astype(np.int64)
+
+
+def hourly_seconds(runs: StateRuns, point_index: np.ndarray, point_count: int, include: np.ndarray,
+        start: float, end: float) -> np.ndarray:
+    """Seconds each point spent in runs marked by ``include``, in each hour of
+    the week, as a points x 168 array.
+
+    Runs of all points are laid end to end, each point getting its own
+    ``end - start`` stretch, so the time spent up to any moment can be found
+    for every point and every hour boundary at once with ``searchsorted``.
+    """
+    span = end - start
+    run_start = point_index * span + (runs.start - start)
+    run_length = runs.duration
+    weighted = np.where(include, run_length, 0.0)
+    before = np.concatenate(([0.0], np.cumsum(weighted)[:-1]))
+
+    edges = np.arange(np.floor(start / HOUR) * HOUR, end + HOUR, HOUR)
+    edges = np.clip(edges, start, end)
+    bins = hour_of_week(edges[:-1])
+
+    result = np.zeros((point_count, HOURS_PER_WEEK))
+    chunk = max(1, MAX_HEATMAP_CELLS // len(edges))
+    for first in range(0, point_count, chunk):
+        points = np.arange(first, min(point_count, first + chunk))
+        positions = points[:, None] * span + (edges - start)[None, :]
+        run = np.searchsorted(run_start, positions, 'right') - 1
+        valid = run >= 0
+        run = np.maximum(run, 0)
+        spent = before[run] + np.clip(positions - run_start[run], 0, run_length[run]) * include[run]
+        spent = np.where(valid, spent, 0.0)
+        seconds = np.diff(spent, axis=1)
+        cells = (points[:, None] - first) * HOURS_PER_WEEK + bins[None, :]
+        result[points] = np.bincount(
+            cells.ravel(), weights=seconds.ravel(), minlength=len(points) * HOURS_PER_WEEK,
+        ).reshape(len(points), HOURS_PER_WEEK)
+    return result
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def utilisation(history: History, start: Optional[float]=None, end: Optional[float]=None,
+        connector_types: Optional[Iterable[ConnectorType]]=None,
+        percentiles: Sequence[int]=DEFAULT_PERCENTILES) -> Tuple[List[Utilisation], List[Utilisation]]:
+    """Utilisation of each point, and each site, between ``start`` (default,
+    the start of the history) and ``end`` (default, now). Points can be limited
+    to some connector types. Returns (points, sites)."""
+    if end is None:
+        end = time.time()
+
+    with history.columns() as (columns, rows):
+        timestamps, site_codes, point_codes, states, connector_points, connector_codes = _extract(columns, end)
+
+    if start is None:
+        start = float(timestamps[0]) if len(timestamps) else end
+    if end <= start or not len(timestamps):
+        return [], []
+
+    # each point's latest connector type
+    last_connector: Mapping[int, int] = dict(zip(connector_points.tolist(), connector_codes.tolist()))
+
+    runs = state_runs(point_codes, timestamps, states, start, end)
+    point_guids, point_index = np.unique(runs.point, return_inverse=True)
+    point_count = len(point_guids)
+    # the site of each point, from its latest row
+    _, last_rows = np.unique(point_codes[::-1], return_index=True)
+    point_sites = site_codes[::-1][last_rows]
+    point_connector_types = np.array([last_connector.get(int(code), NO_VALUE) for code in point_guids])
+
+    if connector_types is not None:
+        wanted = np.array([CONNECTOR_TYPES.index(connector_type) for connector_type in connector_types])
+        keep_point = np.isin(point_connector_types, wanted)
+        keep_run = keep_point[point_index]
+        runs = StateRuns(*(column[keep_run] for column in runs))
+        point_guids, point_index = np.unique(runs.point, return_inverse=True)
+        point_sites = point_sites[keep_point]
+        point_connector_types = point_connector_types[keep_point]
+        point_count = len(point_guids)
+        if not point_count:
+            return [], []
+
+    site_guids, site_index = np.unique(point_sites, return_inverse=True)
+    site_count = len(site_guids)
+
+    durations = runs.duration
+    state_seconds = np.bincount(
+        point_index * len(STATES) + np.where(runs.state >= 0, runs.state, UNKNOWN),
+        weights=durations, minlength=point_count * len(STATES),
+    ).reshape(point_count, len(STATES))
+    site_state_seconds = np.zeros((site_count, len(STATES)))
+    np.add.at(site_state_seconds, site_index, state_seconds)
+
+    session_points, session_lengths = sessions(StateRuns(point_index, *runs[1:]))
+    session_sites = site_index[session_points]
+
+    known = (runs.state >= 0) & (runs.state != UNKNOWN)
+    available_hours = hourly_seconds(runs, point_index, point_count, (runs.state == AVAILABLE), start, end)
+    observed_hours = hourly_seconds(runs, point_index, point_count, known, start, end)
+    site_available_hours = np.zeros((site_count, HOURS_PER_WEEK))
+    site_observed_hours = np.zeros((site_count, HOURS_PER_WEEK))
+    np.add.at(site_available_hours, site_index, available_hours)
+    np.add.at(site_observed_hours, site_index, observed_hours)
+
+    def summarise(seconds, groups, group_count, available, observed):
+        occupancy = 100 * _ratio(seconds[:, CHARGING], seconds[:, CHARGING] + seconds[:, AVAILABLE])
+        return (
+            occupancy,
+            np.bincount(groups, minlength=group_count),
+            group_means(groups, session_lengths, group_count),
+            group_percentiles(groups, session_lengths, group_count, percentiles),
+            seconds[:, OFFLINE] / 60,
+            _ratio(available, observed).reshape(group_count, 7, 24),
+        )
+
+    def results(guids, site_guids_, connector_codes_, summary):
+        return [
+            Utilisation(
+                history.lookup(int(site_guid)),
+                None if guid is None else history.lookup(int(guid)),
+                None if connector_code is None or connector_code == NO_VALUE else CONNECTOR_TYPES[connector_code],
+                float(occupancy), int(count), float(mean),
+                {percentile: float(value) for percentile, value in zip(percentiles, values)},
+                float(offline_minutes), heatmap,
+            )
+            for guid, site_guid, connector_code, occupancy, count, mean, values, offline_minutes, heatmap
+            in zip(guids, site_guids_, connector_codes_, *summary)
+        ]
+
+    points = results(
+        point_guids, point_sites, point_connector_types,
+        summarise(state_seconds, session_points, point_count, available_hours, observed_hours))
+    sites = results(
+        [None] * site_count, site_guids, [None] * site_count,
+        summarise(site_state_seconds, session_sites, site_count, site_available_hours, site_observed_hours))
+    return points, sites
+
+
+def _parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed.timestamp()
+
+
+def _format_minutes(seconds: float) -> str:
+    if np.isnan(seconds):
+        return '-'
+    return f'{seconds / 60:.0f}m'
+
+
+def format_text(result: Utilisation, percentiles: Sequence[int], heatmap: bool=False) -> List[str]:
+    name = result.site_guid if result.point_guid is None else f'  {result.point_guid}'
+    if result.connector_type is not None:
+        name = f'{name} ({result.connector_type.value})'
+    occupancy = '-' if np.isnan(result.occupancy) else f'{result.occupancy:.1f}%'
+    session_percentiles = ', '.join(
+        f'p{percentile} {_format_minutes(result.session_percentiles[percentile])}' for percentile in percentiles)
+    lines = [
+        name,
+        f'    occupancy {occupancy}, {result.sessions} sessions, mean {_format_minutes(result.session_mean)}, '
+        f'{session_percentiles}, offline {result.offline_minutes:.0f}m',
+    ]
+    if heatmap:
+        for day, hours in zip(('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'), result.heatmap):
+            lines.append(f'    {day} ' + ' '.join('  -' if np.isnan(hour) else f'{hour * 100:3.0f}' for hour in hours))
+    return lines
+
+
+def as_json(result: Utilisation) -> Mapping[str, Any]:
+    def number(value):
+        return None if np.isnan(value) else value
+
+    return {
+        'site_guid': result.site_guid,
+        'point_guid': result.point_guid,
+        'connector_type': None if result.connector_type is None else result.connector_type.value,
+        'occupancy': number(result.occupancy),
+        'sessions': result.sessions,
+        'session_mean': number(result.session_mean),
+        'session_percentiles': {str(k): number(v) for k, v in result.session_percentiles.items()},
+        'offline_minutes': result.offline_minutes,
+        'heatmap': [[number(hour) for hour in day] for day in result.heatmap.tolist()],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report utilisation of charge points from recorded history.')
+    parser.add_argument('history', help='History directory, as given to evcharge-status --history.')
+    parser.add_argument('--start', type=_parse_time, help='Start of the period, as an ISO date/time or epoch seconds.')
+    parser.add_argument('--end', type=_parse_time, help='End of the period. Defaults to now.')
+    parser.add_argument(
+        '--connector-type', action='append', choices=[c.value for c in ConnectorType],
+        help='Only include points with this connector type. May be repeated.')
+    parser.add_argument(
+        '--percentile', action='append', type=int,
+        help=f'Session length percentile to report. May be repeated. Defaults to {DEFAULT_PERCENTILES}.')
+    parser.add_argument('--heatmap', action='store_true', help='Include hour of week availability heatmaps.')
+    parser.add_argument('--json', action='store_true', help='Output JSON.')
+    args = parser.parse_args(argv)
+
+    percentiles = tuple(args.percentile or DEFAULT_PERCENTILES)
+    connector_types = None
+    if args.connector_type:
+        connector_types = [ConnectorType(value) for value in args.connector_type]
+
+    history = History(args.history)
+    points, sites = utilisation(history, args.start, args.end, connector_types, percentiles)
+
+    if args.json:
+        json.dump({
+            'sites': [as_json(site) for site in sites],
+            'points': [as_json(point) for point in points],
+        }, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return 0
+
+    points_by_site = {}
+    for point in points:
+        points_by_site.setdefault(point.site_guid, []).append(point)
+    for site in sites:
+        for line in format_text(site, percentiles, args.heatmap):
+            print(line)
+        for point in points_by_site.get(site.site_guid, []):
+            for line in format_text(point, percentiles, args.heatmap):
+                print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Entry point for running as an AWS Lambda function, e.g. on an EventBridge
+schedule. Configure the handler as ``evcharge_status.aws_lambda.handler``.
+
+Options are taken from the same environment variables as the command line.
+The event may give ``search_keys`` (a list) or a single ``search_key``,
+otherwise ``EVCHARGE_SEARCH_KEY`` or ``EVCHARGE_SEARCH_KEY_FILE`` is used.
+Each key is compared against the stored state, as with
+``evcharge-status --diff``.
+
+The HTTP session, store client and search index are kept at module scope, so
+warm invocations reuse their connections rather than setting them up again.
+"""
+import asyncio
+import json
+import os
+import sys
+from typing import Any, List, Mapping, MutableMapping, Optional, Sequence, Set
+
+from evcharge_status import cli
+from evcharge_status.index import SearchIndex
+from evcharge_status.models import Site
+from evcharge_status.stores import get_store
+
+
+# seconds of the invocation's time to leave for flushing notifications and the store
+DEFAULT_TIME_MARGIN = 5.0
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_runtime: Optional['Runtime'] = None
+
+
+class Runtime:
+    """Everything which can be reused between warm invocations."""
+
+    time_margin: float
+
+    def __init__(self, args):
+        self.args = args
+        self.time_margin = float(os.getenv('EVCHARGE_LAMBDA_TIME_MARGIN', DEFAULT_TIME_MARGIN))
+        self.store = get_store(args.store)
+        self.session_provider = cli.get_session_provider(args)
+        self.evcharge = cli.get_evcharge(args, self.session_provider)
+        self.index = SearchIndex(self.store, self.evcharge, args.search_cache_ttl)
+        self._entered = False
+
+    async def _process_key(self, key: str, notifier, seen: Set[str]) -> List[Site]:
+        sites = [site async for site in self.index.search(key)]
+        # keys often overlap, only check each site once
+        sites = [site for site in sites if site.guid not in seen]
+        seen.update(site.guid for site in sites)
+        changed_sites = await cli.diff_with_store(sites, self.store, notifier, self.args.quiet)
+        await self.index.record_points(*sites)
+        return changed_sites
+
+    async def run(self, search_keys: Sequence[str], timeout: Optional[float]=None) -> Mapping[str, Any]:
+        if not self._entered:
+            await self.evcharge.__aenter__()
+            self._entered = True
+
+        result: MutableMapping[str, Any] = {'changed': [], 'timed_out': [], 'failed': {}}
+        # notifiers are cheap, but must have sent everything before we're frozen
+        notifier = cli.get_notifier(self.args, self.session_provider, self.store)
+        async with notifier:
+            seen: Set[str] = set()
+            tasks = {
+                asyncio.ensure_future(self._process_key(key, notifier, seen)): key
+                for key in search_keys
+            }
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=timeout)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+            for task, key in tasks.items():
+                if task.cancelled():
+                    result['timed_out'].append(key)
+                elif task.exception() is not None:
+                    result['failed'][key] = repr(task.exception())
+                else:
+                    result['changed'].extend(site.guid for site in task.result())
+
+        await asyncio.gather(self.store.flush(), self.index.close())
+        return result
+
+
+def get_search_keys(event: Mapping[str, Any]) -> List[str]:
+    if event.get('search_keys'):
+        return list(event['search_keys'])
+    if event.get('search_key'):
+        return [event['search_key']]
+    return list(_runtime.args.search_keys)
+
+
+def handler(event: Optional[Mapping[str, Any]], context: Any) -> Mapping[str, Any]:
+    global _loop, _runtime
+
+    if _loop is None:
+        # sessions belong to a loop, so the loop has to outlive each invocation too
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    if _runtime is None:
+        # search keys may come from each event instead of the environment
+        _runtime = Runtime(cli.parse_args([], require_search_key=False))
+
+    timeout = None
+    if context is not None:
+        timeout = max(0.0, context.get_remaining_time_in_millis() / 1000 - _runtime.time_margin)
+
+    return _loop.run_until_complete(_runtime.run(get_search_keys(event or {}), timeout))
+
+
+def main(argv=None):
+    """Run the handler once locally, with search keys from the command line."""
+    if argv is None:
+        argv = sys.argv[1:]
+
+    print(json.dumps(handler({'search_keys': argv}, None), indent=2))
+
+
+if __name__ == '__main__':
+    main()
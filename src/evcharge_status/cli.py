@@ -1,24 +1,33 @@
 import argparse
 import asyncio
+import itertools
+import logging
 import os
 import signal
 import sys
 import threading
 
-from evcharge_status.notifications.file import Notifier as FileNotifier
-from evcharge_status.notifications.multi import Notifier as MultiNotifier
-from evcharge_status.notifications.slack import Notifier as SlackNotifier
-from evcharge_status.scraper import EVCharge
+# Anything heavy (aiohttp, bs4, Slack, watching) is imported where it's used,
+# to keep start up quick for one-shot runs, e.g. under Lambda.
+from evcharge_status.index import DEFAULT_TTL as DEFAULT_SEARCH_CACHE_TTL, SearchIndex
+from evcharge_status.models import SiteDiff
 from evcharge_status.stores import get_store
-from evcharge_status.watcher import Watcher
 
 
 def get_argument_parser():
     parser = argparse.ArgumentParser(description='Get or monitor status of an EVCharge.online site')
     parser.add_argument(
-        'search_key',
-        help='A site name, or charge point ID.',
-        default=os.getenv("EVCHARGE_SEARCH_KEY")
+        'search_keys',
+        nargs='*',
+        metavar='search_key',
+        help='A site name, or charge point ID. May be repeated, sites found by more than one are only checked once.',
+        default=[os.getenv("EVCHARGE_SEARCH_KEY")] if os.getenv("EVCHARGE_SEARCH_KEY") else []
+        )
+    parser.add_argument(
+        '-f', '--search-key-file',
+        type=argparse.FileType('r'),
+        help='File of search keys, one per line. Blank lines and lines starting with # are ignored.',
+        default=os.getenv("EVCHARGE_SEARCH_KEY_FILE")
         )
     parser.add_argument(
         '-w', '--watch',
@@ -28,17 +37,78 @@ def get_argument_parser():
             os.getenv("EVCHARGE_WATCH", "").lower()
             in ('yes', '1', 'true', 'y', 'on')
         ))
+    parser.add_argument(
+        '-d', '--diff',
+        action='store_true',
+        help=(
+            'Compare with the state in the store, and only report and store changes. '
+            'Useful when run on a schedule.'
+        ),
+        default=(
+            os.getenv("EVCHARGE_DIFF", "").lower()
+            in ('yes', '1', 'true', 'y', 'on')
+        ))
     parser.add_argument(
         '-p', '--period',
         type=int,
         help='Time to wait in seconds between checking status of the site.',
         default=int(os.getenv('EVCHARGE_WATCH_PERIOD', 300))
         )
+    parser.add_argument(
+        '--max-period',
+        type=int,
+        help=(
+            'Poll each site on its own schedule, backing off idle or offline sites up to this '
+            'many seconds. Charging or changed sites are polled every --period seconds.'
+        ),
+        default=int(os.getenv('EVCHARGE_WATCH_MAX_PERIOD', 0)) or None
+        )
+    parser.add_argument(
+        '-c', '--concurrency',
+        type=int,
+        help='Maximum number of sites to refresh at once when watching.',
+        default=int(os.getenv('EVCHARGE_WATCH_CONCURRENCY', 1))
+        )
+    parser.add_argument(
+        '--parser',
+        choices=('bs4', 'lxml'),
+        help='HTML parser backend used to read charge point pages. Falls back to bs4 if unavailable.',
+        default=os.getenv("EVCHARGE_PARSER", 'bs4')
+        )
     parser.add_argument(
         '--store',
         help='Location to store the current state.',
         default=os.getenv("EVCHARGE_STORE", 'site.json')
         )
+    parser.add_argument(
+        '--search-cache-ttl',
+        type=float,
+        help=(
+            'Reuse the sites found for a search key for this many seconds before searching again '
+            'in the background. 0 to always search.'
+        ),
+        default=float(os.getenv('EVCHARGE_SEARCH_CACHE_TTL', DEFAULT_SEARCH_CACHE_TTL))
+        )
+    parser.add_argument(
+        '--history',
+        help='Directory to record every change in, for later analysis.',
+        default=os.getenv('EVCHARGE_HISTORY')
+        )
+    parser.add_argument(
+        '--write-behind-interval',
+        type=float,
+        help=(
+            'When watching, buffer changed sites and write them to the store at most once '
+            'every this many seconds. 0 writes every change immediately.'
+        ),
+        default=float(os.getenv('EVCHARGE_WRITE_BEHIND_INTERVAL', 0))
+        )
+    parser.add_argument(
+        '--write-behind-size',
+        type=int,
+        help='Write buffered sites to the store as soon as this many are waiting.',
+        default=int(os.getenv('EVCHARGE_WRITE_BEHIND_SIZE', 100))
+        )
     parser.add_argument(
         '-o', '--output',
         type=argparse.FileType('w'),
@@ -53,7 +123,94 @@ def get_argument_parser():
             os.getenv("EVCHARGE_QUIET", "").lower()
             in ('yes', '1', 'true', 'y', 'on')
         ))
-    
+    parser.add_argument(
+        '--log-level',
+        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+        type=str.upper,
+        help='Level of diagnostic messages to write to stderr.',
+        default=os.getenv('EVCHARGE_LOG_LEVEL', 'WARNING').upper()
+        )
+
+    http_group = parser.add_argument_group('HTTP options')
+    http_group.add_argument(
+        '--http-limit-per-host',
+        type=int,
+        help='Maximum number of simultaneous connections to each host.',
+        default=int(os.getenv('EVCHARGE_HTTP_LIMIT_PER_HOST', 10))
+        )
+    http_group.add_argument(
+        '--http-keepalive',
+        type=float,
+        help='Time in seconds to keep idle connections open for reuse.',
+        default=float(os.getenv('EVCHARGE_HTTP_KEEPALIVE', 30))
+        )
+    http_group.add_argument(
+        '--http-dns-cache-ttl',
+        type=int,
+        help='Time in seconds to cache DNS lookups for.',
+        default=int(os.getenv('EVCHARGE_HTTP_DNS_CACHE_TTL', 300))
+        )
+    http_group.add_argument(
+        '--http-timeout',
+        type=float,
+        help='Total time in seconds allowed for any single request.',
+        default=float(os.getenv('EVCHARGE_HTTP_TIMEOUT', 60))
+        )
+    http_group.add_argument(
+        '--http-connect-timeout',
+        type=float,
+        help='Time in seconds allowed to establish a connection.',
+        default=float(os.getenv('EVCHARGE_HTTP_CONNECT_TIMEOUT', 10))
+        )
+    http_group.add_argument(
+        '--http-read-timeout',
+        type=float,
+        help='Time in seconds allowed between reads of a response.',
+        default=float(os.getenv('EVCHARGE_HTTP_READ_TIMEOUT', 30))
+        )
+    http_group.add_argument(
+        '--rate-limit',
+        type=float,
+        help='Maximum average number of requests per second to EVCharge.online. 0 for no limit.',
+        default=float(os.getenv('EVCHARGE_RATE_LIMIT', 0))
+        )
+    http_group.add_argument(
+        '--rate-burst',
+        type=float,
+        help='Number of requests to EVCharge.online allowed in a burst above --rate-limit.',
+        default=float(os.getenv('EVCHARGE_RATE_BURST', 0)) or None
+        )
+    http_group.add_argument(
+        '--retries',
+        type=int,
+        help='Number of times to retry a request to EVCharge.online after a transient failure.',
+        default=int(os.getenv('EVCHARGE_RETRIES', 3))
+        )
+    http_group.add_argument(
+        '--retry-backoff',
+        type=float,
+        help='Base delay in seconds for exponential backoff between retries.',
+        default=float(os.getenv('EVCHARGE_RETRY_BACKOFF', 0.5))
+        )
+    http_group.add_argument(
+        '--retry-max-delay',
+        type=float,
+        help='Maximum delay in seconds between retries.',
+        default=float(os.getenv('EVCHARGE_RETRY_MAX_DELAY', 30))
+        )
+    http_group.add_argument(
+        '--breaker-threshold',
+        type=int,
+        help='Consecutive failures before requests to EVCharge.online are paused. 0 to disable.',
+        default=int(os.getenv('EVCHARGE_BREAKER_THRESHOLD', 5))
+        )
+    http_group.add_argument(
+        '--breaker-reset',
+        type=float,
+        help='Time in seconds to pause requests to EVCharge.online once the failure threshold is reached.',
+        default=float(os.getenv('EVCHARGE_BREAKER_RESET', 60))
+        )
+
     slack_group = parser.add_argument_group('Slack options')
     slack_group.add_argument(
         '--slack-hook-url',
@@ -68,7 +225,7 @@ def get_argument_parser():
     slack_group.add_argument(
         '--slack-channel-id',
         help="Channel ID of the Slack channel to post updates to.",
-        default=os.getenv('SLACK_CHANNEL_ID"')
+        default=os.getenv('SLACK_CHANNEL_ID')
         )
     slack_group.add_argument(
         '--slack-icon-emoji',
@@ -80,18 +237,48 @@ def get_argument_parser():
         help='Username for the Slack bot messages.',
         default=os.getenv('SLACK_USERNAME')
         )
+    slack_group.add_argument(
+        '--slack-update-in-place',
+        action='store_true',
+        help='Keep one status message per site up to date, rather than posting a new message for each change.',
+        default=(
+            os.getenv("SLACK_UPDATE_IN_PLACE", "").lower()
+            in ('yes', '1', 'true', 'y', 'on')
+        ))
     return parser
 
 
-def parse_args(argv):
+def read_search_keys(lines):
+    keys = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            keys.append(line)
+    return keys
+
+
+def parse_args(argv, require_search_key=True):
     parser = get_argument_parser()
     args = parser.parse_args(argv)
+    if args.search_key_file:
+        with args.search_key_file:
+            args.search_keys = [*args.search_keys, *read_search_keys(args.search_key_file)]
+    if require_search_key and not args.search_keys:
+        parser.error("at least one search key is required")
+    if args.diff and args.watch:
+        parser.error("--diff cannot be specified with --watch")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.max_period is not None and args.max_period < args.period:
+        parser.error("--max-period must not be less than --period")
     if args.slack_channel_id and args.slack_hook_url:
         parser.error("--slack-channel-id cannot be specified with --slack-hook-url")
     if args.slack_icon_emoji and args.slack_hook_url:
         parser.error("--slack-icon-emoji cannot be specified with --slack-hook-url")
     if args.slack_username and args.slack_hook_url:
         parser.error("--slack-username cannot be specified with --slack-hook-url")
+    if args.slack_update_in_place and args.slack_hook_url:
+        parser.error("--slack-update-in-place cannot be specified with --slack-hook-url")
     return args
 
 
@@ -115,42 +302,154 @@ def multiwait(coro):
     return waiter(), wrapper()
 
 
+async def search_all(index, search_keys):
+    """Search for all keys at once. Sites found by more than one key are only
+    returned once, in the order first found."""
+    results = await asyncio.gather(*[
+        collect(index.search(key)) for key in dict.fromkeys(search_keys)
+    ])
+    sites = {}
+    for site in itertools.chain.from_iterable(results):
+        sites.setdefault(site.guid, site)
+    return list(sites.values())
+
+
+async def collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+async def diff_with_store(sites, store, notifier, quiet=False):
+    """Refresh sites, and compare them with the state in the store. Only
+    changed sites are reported and stored. Sites which aren't in the store yet
+    are stored, and reported unless ``quiet``. Returns the changed sites."""
+
+    async def get_old_sites():
+        return {site.guid: site async for site in store.get_sites(*[site.guid for site in sites])}
+
+    # read the previous state while the new one is being fetched
+    old_sites, *_ = await asyncio.gather(
+        get_old_sites(),
+        *[site.refresh_points() for site in sites],
+    )
+
+    changed_sites = []
+    notification_awaitables = []
+    for site in sites:
+        old_site = old_sites.get(site.guid)
+        if old_site is None:
+            changed_sites.append(site)
+            if not quiet:
+                notification_awaitables.append(notifier.notify_state(site))
+            continue
+
+        diff = SiteDiff.from_sites(old_site, site)
+        if diff:
+            changed_sites.append(site)
+            notification_awaitables.append(notifier.notify_changes(diff))
+
+    async def store_awaitable():
+        if changed_sites:
+            await store.put_sites(*changed_sites)
+
+    await asyncio.gather(store_awaitable(), *notification_awaitables)
+    return changed_sites
+
+
+def get_session_provider(args):
+    from evcharge_status.sessions import SessionProvider
+
+    return SessionProvider(
+        limit_per_host=args.http_limit_per_host,
+        keepalive_timeout=args.http_keepalive,
+        dns_cache_ttl=args.http_dns_cache_ttl,
+        total_timeout=args.http_timeout,
+        connect_timeout=args.http_connect_timeout,
+        read_timeout=args.http_read_timeout,
+    )
+
+
+def get_notifier(args, session_provider, store):
+    from evcharge_status.notifications.file import Notifier as FileNotifier
+
+    notifiers = [FileNotifier(args.output)]
+    slack_secret = args.slack_hook_url or args.slack_token
+    if slack_secret:
+        from evcharge_status.notifications.slack import Notifier as SlackNotifier
+
+        notifiers.append(SlackNotifier(
+            slack_secret, args.slack_channel_id, args.slack_icon_emoji, args.slack_username,
+            session_provider=session_provider,
+            store=store,
+            update_in_place=args.slack_update_in_place
+        ))
+    if args.history:
+        from evcharge_status.notifications.history import Notifier as HistoryNotifier
+
+        notifiers.append(HistoryNotifier(args.history))
+
+    if len(notifiers) == 1:
+        return notifiers[0]
+
+    from evcharge_status.notifications.multi import Notifier as MultiNotifier
+
+    return MultiNotifier(notifiers)
+
+
+def get_evcharge(args, session_provider):
+    from evcharge_status.resilience import CircuitBreaker, RetryPolicy, TokenBucket
+    from evcharge_status.scraper import EVCharge
+
+    return EVCharge(
+        args.parser,
+        session_provider,
+        TokenBucket(args.rate_limit, args.rate_burst),
+        RetryPolicy(args.retries, args.retry_backoff, args.retry_max_delay),
+        CircuitBreaker(args.breaker_threshold, args.breaker_reset)
+    )
+
+
 async def async_main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
     args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
     store = get_store(args.store)
-    output_file = args.output
+    if args.watch and args.write_behind_interval > 0:
+        from evcharge_status.stores.write_behind import WriteBehindStore
 
-    slack_secret = args.slack_hook_url or args.slack_token
-    notifier = FileNotifier(output_file)
-    if slack_secret:
-        notifier = MultiNotifier([
-            notifier,
-            SlackNotifier(slack_secret, args.slack_channel_id, args.slack_icon_emoji, args.slack_username)
-        ])
-    async with notifier:
-        async with EVCharge() as evcharge:
-            sites = [s async for s in evcharge.search(args.search_key)]
-            notification_awaitables = []
-            store_awaitables = []
-            for site in sites:
-                refresh_waiter, refresh_executor = multiwait(site.refresh_points())
-                store_awaitables.append(refresh_executor)
-                async def notification_awaitable():
-                    await refresh_waiter
-                    if not args.quiet:
-                        await notifier.notify_state(site)
-                notification_awaitables.append(notification_awaitable())
-            
-            async def store_awaitable():
-                await asyncio.gather(*store_awaitables)
-                await store.put_sites(*sites)
-
-            await asyncio.gather(store_awaitable(), *notification_awaitables)
+        store = WriteBehindStore(store, args.write_behind_interval, args.write_behind_size)
+
+    session_provider = get_session_provider(args)
+    notifier = get_notifier(args, session_provider, store)
+    async with session_provider, notifier:
+        async with get_evcharge(args, session_provider) as evcharge, SearchIndex(store, evcharge, args.search_cache_ttl) as index:
+            sites = await search_all(index, args.search_keys)
+            if args.diff:
+                await diff_with_store(sites, store, notifier, args.quiet)
+                await index.record_points(*sites)
+            else:
+                notification_awaitables = []
+                store_awaitables = []
+                for site in sites:
+                    refresh_waiter, refresh_executor = multiwait(site.refresh_points())
+                    store_awaitables.append(refresh_executor)
+                    # bound now, not when awaited, or every one would wait on the last site
+                    async def notification_awaitable(site=site, refresh_waiter=refresh_waiter):
+                        await refresh_waiter
+                        if not args.quiet:
+                            await notifier.notify_state(site)
+                    notification_awaitables.append(notification_awaitable())
+
+                async def store_awaitable():
+                    await asyncio.gather(*store_awaitables)
+                    await asyncio.gather(store.put_sites(*sites), index.record_points(*sites))
+
+                await asyncio.gather(store_awaitable(), *notification_awaitables)
 
             if args.watch:
+                from evcharge_status.scheduler import Scheduler
+                from evcharge_status.watcher import Watcher
 
                 loop = asyncio.get_running_loop()
                 async def notify_current_state():
@@ -170,12 +469,17 @@ async def async_main(argv=None):
                 def stop_on_signal(sig, *args):
                     watcher.stop()
 
-                watcher = Watcher(sites, args.period, store, notifier)
+                scheduler = None
+                if args.max_period:
+                    scheduler = Scheduler(sites, args.period, args.max_period)
+                watcher = Watcher(sites, args.period, store, notifier, args.concurrency, scheduler)
                 add_signal_handler(signal.SIGINT, stop_on_signal)
 
                 async with watcher:
                     await watcher.run()
 
+    await store.close()
+
 
 def main(argv=None):
     loop = asyncio.get_event_loop()
@@ -0,0 +1,358 @@
+from array import array
+from bisect import bisect_left
+import contextlib
+from decimal import Decimal
+import json
+import mmap
+import os
+import sys
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, MutableMapping, NamedTuple, Optional, Tuple
+
+from .models import POINT_ATTRIBUTES, SITE_ATTRIBUTES, ConnectorType, Site, SiteDiff, State
+
+
+FORMAT_VERSION = 1
+
+# Codes are positions in these tuples, and are written to disk, so only ever
+# append to them.
+ATTRIBUTES = (
+    'name', 'address', 'town', 'county', 'postcode', 'country', 'lat', 'lng',
+    'price', 'connector_type', 'point_id', 'state', 'max_power',
+)
+STATES = (State.UNKNOWN, State.AVAILABLE, State.CHARGING, State.OFFLINE)
+CONNECTOR_TYPES = (
+    ConnectorType.UNKNOWN, ConnectorType.UK_3_PIN, ConnectorType.CCS, ConnectorType.CHADEMO,
+    ConnectorType.TYPE_1, ConnectorType.TYPE_2,
+)
+ENUM_ATTRIBUTES = {
+    'state': STATES,
+    'connector_type': CONNECTOR_TYPES,
+}
+
+ATTRIBUTE_CODES = {attribute: code for code, attribute in enumerate(ATTRIBUTES)}
+ENUM_CODES = {
+    attribute: {member: code for code, member in enumerate(members)}
+    for attribute, members in ENUM_ATTRIBUTES.items()
+}
+
+# one file per column, each an array of native machine values
+COLUMNS = (
+    ('timestamp', 'd'),
+    ('site', 'I'),
+    ('point', 'I'),
+    ('attribute', 'B'),
+    ('old', 'i'),
+    ('new', 'i'),
+)
+
+# in the point column, for changes to the site's own details
+NO_POINT = 0xFFFFFFFF
+# in the old and new columns
+NO_VALUE = -1
+
+DICTIONARY_FILE = 'dictionary.jsonl'
+META_FILE = 'meta.json'
+
+
+class Transition(NamedTuple):
+    timestamp: float
+    site_guid: str
+    point_guid: Optional[str]
+    attribute: str
+    old: Any
+    new: Any
+
+
+class History:
+    """An append-only record of every change seen, one row per changed
+    attribute, kept as a directory of column files.
+
+    Enum values are stored as their position in ``STATES`` or
+    ``CONNECTOR_TYPES``. GUIDs and other values are stored as their line
+    number in a dictionary file, so each row takes 25 bytes. Queries memory
+    map the columns, find a time range by bisecting the timestamps (rows are
+    recorded in time order), and only decode the rows which match.
+    """
+
+    directory: str
+
+    def __init__(self, directory: str, clock: Callable[[], float]=time.time):
+        self.directory = directory
+        self._clock = clock
+        os.makedirs(directory, exist_ok=True)
+        self._check_meta()
+        self._values: List[Any] = []
+        self._codes: MutableMapping[bytes, int] = {}
+        self._dictionary_size = 0
+        self._load_dictionary()
+        self._files = None
+        # the last value recorded for each (site, point, attribute), built when first needed
+        self._latest: Optional[MutableMapping[Tuple[int, int, int], int]] = None
+        self._last_timestamp = 0.0
+        with self.columns() as (columns, rows):
+            if rows:
+                self._last_timestamp = columns['timestamp'][rows - 1]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _check_meta(self) -> None:
+        meta = {'version': FORMAT_VERSION, 'byteorder': sys.byteorder, 'columns': COLUMNS}
+        try:
+            with open(self._path(META_FILE)) as fh:
+                existing = json.load(fh)
+        except FileNotFoundError:
+            with open(self._path(META_FILE), 'w') as fh:
+                json.dump(meta, fh)
+            return
+
+        if existing['version'] != FORMAT_VERSION or existing['byteorder'] != sys.byteorder:
+            raise ValueError(
+                f'History in {self.directory} is version {existing["version"]}, {existing["byteorder"]} endian, '
+                f'expected version {FORMAT_VERSION}, {sys.byteorder} endian')
+
+    def _load_dictionary(self) -> None:
+        try:
+            with open(self._path(DICTIONARY_FILE), 'rb') as fh:
+                for line in fh:
+                    if not line.endswith(b'\n'):
+                        # torn write, never referenced by a row
+                        break
+                    self._codes.setdefault(line, len(self._values))
+                    self._values.append(json.loads(line))
+                    self._dictionary_size += len(line)
+        except FileNotFoundError:
+            pass
+
+    def _open(self) -> Mapping[str, Any]:
+        if self._files is None:
+            rows = self._row_count()
+            self._files = {}
+            for name, typecode in COLUMNS:
+                fh = open(self._path(f'{name}.col'), 'ab')
+                # drop any partly written rows
+                fh.truncate(rows * array(typecode).itemsize)
+                self._files[name] = fh
+            dictionary = open(self._path(DICTIONARY_FILE), 'ab')
+            dictionary.truncate(self._dictionary_size)
+            self._files['dictionary'] = dictionary
+        return self._files
+
+    def _row_count(self) -> int:
+        rows = []
+        for name, typecode in COLUMNS:
+            try:
+                size = os.path.getsize(self._path(f'{name}.col'))
+            except FileNotFoundError:
+                size = 0
+            rows.append(size // array(typecode).itemsize)
+        return min(rows)
+
+    @classmethod
+    def _dictionary_line(cls, value: Any) -> bytes:
+        return json.dumps(value).encode('ascii') + b'\n'
+
+    def _code(self, value: Any) -> int:
+        if value is None:
+            return NO_VALUE
+        line = self._dictionary_line(value)
+        code = self._codes.get(line)
+        if code is None:
+            code = len(self._values)
+            self._open()['dictionary'].write(line)
+            self._dictionary_size += len(line)
+            self._codes[line] = code
+            self._values.append(value)
+        return code
+
+    def _encode(self, attribute: str, value: Any) -> int:
+        if value is None:
+            return NO_VALUE
+        if attribute in ENUM_CODES:
+            return ENUM_CODES[attribute].get(value, 0)
+        if isinstance(value, Decimal):
+            value = str(value)
+        return self._code(value)
+
+    def lookup(self, code: int) -> Any:
+        """The value for a code from the site, point, old or new columns."""
+        if code == NO_VALUE or code == NO_POINT:
+            return None
+        return self._values[code]
+
+    def _decode(self, attribute: str, code: int) -> Any:
+        if code == NO_VALUE:
+            return None
+        if attribute in ENUM_ATTRIBUTES:
+            return ENUM_ATTRIBUTES[attribute][code]
+        value = self._values[code]
+        if attribute == 'price':
+            return Decimal(value)
+        return value
+
+    def _latest_values(self) -> MutableMapping[Tuple[int, int, int], int]:
+        if self._latest is None:
+            latest = {}
+            with self.columns() as (columns, rows):
+                for key in zip(columns['site'], columns['point'], columns['attribute'], columns['new']):
+                    latest[key[:3]] = key[3]
+            self._latest = latest
+        return self._latest
+
+    def _write(self, rows: Mapping[str, array], timestamp: float) -> int:
+        count = len(rows['timestamp'])
+        if not count:
+            return 0
+
+        files = self._open()
+        # the dictionary first, so rows never refer to values which weren't written
+        files['dictionary'].flush()
+        for name, _ in COLUMNS:
+            rows[name].tofile(files[name])
+        for name, _ in COLUMNS:
+            files[name].flush()
+        self._last_timestamp = timestamp
+        if self._latest is not None:
+            for key in zip(rows['site'], rows['point'], rows['attribute'], rows['new']):
+                self._latest[key[:3]] = key[3]
+        return count
+
+    def _timestamp(self, timestamp: Optional[float]) -> float:
+        if timestamp is None:
+            timestamp = self._clock()
+        # keep rows in time order, even if the clock goes backwards
+        return max(timestamp, self._last_timestamp)
+
+    @classmethod
+    def _add_row(cls, rows: Mapping[str, array], timestamp: float, site: int, point: int, attribute: str,
+            old: int, new: int) -> None:
+        rows['timestamp'].append(timestamp)
+        rows['site'].append(site)
+        rows['point'].append(point)
+        rows['attribute'].append(ATTRIBUTE_CODES[attribute])
+        rows['old'].append(old)
+        rows['new'].append(new)
+
+    def record(self, diff: SiteDiff, timestamp: Optional[float]=None) -> int:
+        """Append a row for each changed attribute. Returns the number of rows."""
+        timestamp = self._timestamp(timestamp)
+        rows: MutableMapping[str, array] = {name: array(typecode) for name, typecode in COLUMNS}
+        site = self._code(diff.guid)
+
+        def add(point: int, attribute: str, old: Any, new: Any) -> None:
+            self._add_row(
+                rows, timestamp, site, point, attribute, self._encode(attribute, old), self._encode(attribute, new))
+
+        for attribute, value in diff.differences.items():
+            if attribute == 'points':
+                for guid, changes in value.items():
+                    point = self._code(guid)
+                    for point_attribute, (old, new) in changes.items():
+                        add(point, point_attribute, old, new)
+            elif attribute in ATTRIBUTE_CODES:
+                old, new = value
+                add(NO_POINT, attribute, old, new)
+
+        return self._write(rows, timestamp)
+
+    def record_state(self, site: Site, timestamp: Optional[float]=None) -> int:
+        """Append a row for each attribute of the site and its points which
+        differs from the last value recorded for it, or was never recorded.
+        Gives the history a starting point without repeating what it already
+        knows. Returns the number of rows."""
+        timestamp = self._timestamp(timestamp)
+        latest = self._latest_values()
+        rows: MutableMapping[str, array] = {name: array(typecode) for name, typecode in COLUMNS}
+        site_code = self._code(site.guid)
+
+        def add(point: int, attribute: str, value: Any) -> None:
+            new = self._encode(attribute, value)
+            old = latest.get((site_code, point, ATTRIBUTE_CODES[attribute]), NO_VALUE)
+            if old != new:
+                self._add_row(rows, timestamp, site_code, point, attribute, old, new)
+
+        for attribute in SITE_ATTRIBUTES:
+            add(NO_POINT, attribute, getattr(site, attribute))
+        for guid, point in site.points.items():
+            point_code = self._code(guid)
+            for attribute in POINT_ATTRIBUTES:
+                add(point_code, attribute, getattr(point, attribute))
+
+        return self._write(rows, timestamp)
+
+    @contextlib.contextmanager
+    def columns(self) -> Iterator[Tuple[Mapping[str, memoryview], int]]:
+        """Memory map the columns, as typed memoryviews, and give the number of
+        complete rows."""
+        rows = self._row_count()
+        maps = []
+        # every view has to be released before its map can be closed
+        exported = []
+        views = {}
+        try:
+            for name, typecode in COLUMNS:
+                if not rows:
+                    views[name] = memoryview(array(typecode))
+                    continue
+                with open(self._path(f'{name}.col'), 'rb') as fh:
+                    mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                maps.append(mapped)
+                whole = memoryview(mapped)
+                complete = whole[:rows * array(typecode).itemsize]
+                exported.extend((whole, complete))
+                views[name] = complete.cast(typecode)
+            yield views, rows
+        finally:
+            for view in [*views.values(), *reversed(exported)]:
+                view.release()
+            for mapped in maps:
+                mapped.close()
+
+    def query(self, start: Optional[float]=None, end: Optional[float]=None,
+            site_guids: Optional[Iterable[str]]=None, point_guids: Optional[Iterable[str]]=None,
+            attributes: Optional[Iterable[str]]=None) -> Iterator[Transition]:
+        """Transitions recorded from ``start`` (inclusive) until ``end``
+        (exclusive), optionally only for some sites, points or attributes."""
+
+        def codes_for(guids: Optional[Iterable[str]]):
+            if guids is None:
+                return None
+            return {self._codes.get(self._dictionary_line(guid), NO_VALUE) for guid in guids}
+
+        sites = codes_for(site_guids)
+        points = codes_for(point_guids)
+        attribute_codes = None
+        if attributes is not None:
+            attribute_codes = {ATTRIBUTE_CODES[attribute] for attribute in attributes}
+
+        with self.columns() as (columns, rows):
+            timestamps = columns['timestamp']
+            low = 0 if start is None else bisect_left(timestamps, start, 0, rows)
+            high = rows if end is None else bisect_left(timestamps, end, low, rows)
+            site_column = columns['site']
+            point_column = columns['point']
+            attribute_column = columns['attribute']
+            for i in range(low, high):
+                if sites is not None and site_column[i] not in sites:
+                    continue
+                if points is not None and point_column[i] not in points:
+                    continue
+                if attribute_codes is not None and attribute_column[i] not in attribute_codes:
+                    continue
+                attribute = ATTRIBUTES[attribute_column[i]]
+                point = point_column[i]
+                yield Transition(
+                    timestamps[i],
+                    self._values[site_column[i]],
+                    None if point == NO_POINT else self._values[point],
+                    attribute,
+                    self._decode(attribute, columns['old'][i]),
+                    self._decode(attribute, columns['new'][i]),
+                )
+
+    def close(self) -> None:
+        if self._files is not None:
+            for fh in self._files.values():
+                fh.close()
+            self._files = None
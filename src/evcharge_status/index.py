@@ -0,0 +1,129 @@
+import asyncio
+import time
+from typing import Any, Callable, Generator, List, Mapping, MutableMapping, Optional, Set
+
+from .models import Site
+from .stores import StoreType
+
+
+SEARCH_PREFIX = 'index:search:'
+POINT_PREFIX = 'index:point:'
+SITE_PREFIX = 'index:site:'
+
+SITE_DETAILS = ('name', 'address', 'town', 'county', 'postcode', 'country', 'lat', 'lng')
+
+DEFAULT_TTL = 86400.0
+
+
+class SearchIndex:
+    """Remembers which sites a search key matched, and which site each point ID
+    belongs to, in the store's metadata.
+
+    A key seen within ``ttl`` seconds is answered without searching
+    EVCharge.online. An older entry is still used, but the search is repeated in
+    the background so the next run sees any change. A ``ttl`` of 0 or less
+    always searches.
+    """
+
+    store: StoreType
+    ttl: float
+    _known_points: MutableMapping[str, Set[str]]
+    _tasks: Set[asyncio.Task]
+
+    def __init__(self, store: StoreType, evcharge: Any, ttl: float=DEFAULT_TTL,
+            clock: Callable[[], float]=time.time):
+        self.store = store
+        self.ttl = ttl
+        self._evcharge = evcharge
+        self._clock = clock
+        # point IDs already in the index for each site, to avoid rewriting them
+        self._known_points = {}
+        self._tasks = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @classmethod
+    def format_site(cls, site: Site, point_ids: List[str]) -> Mapping[str, Any]:
+        data = {attr: getattr(site, attr) for attr in SITE_DETAILS}
+        data['point_ids'] = point_ids
+        return data
+
+    def parse_site(self, guid: str, data: Mapping[str, Any]) -> Site:
+        return Site(guid, *(data.get(attr) for attr in SITE_DETAILS), points={}, evcharge=self._evcharge)
+
+    async def _lookup(self, key: str) -> Optional[List[Site]]:
+        entries = await self.store.get_metadata(f'{SEARCH_PREFIX}{key}', f'{POINT_PREFIX}{key}')
+        entry = entries.get(f'{SEARCH_PREFIX}{key}') or entries.get(f'{POINT_PREFIX}{key}')
+        if not entry:
+            return None
+
+        guids = entry['sites']
+        site_entries = await self.store.get_metadata(*[f'{SITE_PREFIX}{guid}' for guid in guids])
+        sites = []
+        for guid in guids:
+            data = site_entries.get(f'{SITE_PREFIX}{guid}')
+            if data is None:
+                # incomplete, search again
+                return None
+            self._known_points[guid] = set(data.get('point_ids', ()))
+            sites.append(self.parse_site(guid, data))
+
+        if self.ttl > 0 and self._clock() - entry['fetched'] > self.ttl:
+            self._revalidate(key)
+        return sites
+
+    async def _search(self, key: str) -> List[Site]:
+        sites = [site async for site in self._evcharge.search(key)]
+        values = {
+            f'{SEARCH_PREFIX}{key}': {'fetched': self._clock(), 'sites': [site.guid for site in sites]},
+        }
+        for site in sites:
+            point_ids = sorted(self._known_points.get(site.guid, ()))
+            values[f'{SITE_PREFIX}{site.guid}'] = self.format_site(site, point_ids)
+        await self.store.put_metadata(values)
+        return sites
+
+    def _revalidate(self, key: str) -> None:
+        task = asyncio.ensure_future(self._search(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def search(self, key: str) -> Generator[Site, None, None]:
+        """Like ``EVCharge.search``, but from the index where possible."""
+        sites = None
+        if self.ttl > 0:
+            sites = await self._lookup(key)
+        if sites is None:
+            sites = await self._search(key)
+
+        for site in sites:
+            yield site
+
+    async def record_points(self, *sites: Site) -> None:
+        """Add the point IDs of refreshed sites to the index, so a later search
+        for any of them can skip EVCharge.online."""
+        now = self._clock()
+        values = {}
+        for site in sites:
+            point_ids = {point.point_id for point in site.points.values() if point.point_id}
+            known = self._known_points.get(site.guid, set())
+            if point_ids <= known:
+                continue
+
+            for point_id in point_ids - known:
+                values[f'{POINT_PREFIX}{point_id}'] = {'fetched': now, 'sites': [site.guid]}
+            point_ids |= known
+            values[f'{SITE_PREFIX}{site.guid}'] = self.format_site(site, sorted(point_ids))
+            self._known_points[site.guid] = point_ids
+
+        if values:
+            await self.store.put_metadata(values)
+
+    async def close(self) -> None:
+        """Wait for any background revalidation to finish."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,7 +1,31 @@
 from decimal import Decimal
 import enum
-from re import S
-from typing import Any, List, MutableMapping, NamedTuple, Optional, Set, Tuple
+import operator
+import sys
+from typing import Any, List, Mapping, MutableMapping, NamedTuple, Optional, Set, Tuple
+
+
+SITE_ATTRIBUTES = ('name', 'address', 'town', 'county', 'postcode', 'country', 'lat', 'lng')
+POINT_ATTRIBUTES = ('price', 'connector_type', 'point_id', 'state', 'max_power')
+
+_site_details = operator.attrgetter(*SITE_ATTRIBUTES)
+
+# only a handful of distinct prices exist, so share one Decimal for each
+_PRICES: MutableMapping[Tuple, Decimal] = {}
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # the same strings are parsed again on every fetch, and kept for every copy
+    if value is None:
+        return None
+    return sys.intern(value)
+
+
+def _intern_price(price: Optional[Decimal]) -> Optional[Decimal]:
+    if price is None:
+        return None
+    # keyed on the exact representation, so 0.18 and 0.180 stay distinct
+    return _PRICES.setdefault(price.as_tuple(), price)
 
 
 class ConnectorType(enum.Enum):
@@ -22,6 +46,9 @@ class State(enum.Enum):
 
 
 class Point:
+
+    __slots__ = ('guid', 'point_id', 'state', 'price', 'max_power', 'connector_type', 'image_url', 'fingerprint')
+
     guid: str
     point_id: str
     state: State
@@ -29,20 +56,28 @@ class Point:
     max_power: float
     connector_type: Optional[ConnectorType]
     image_url: str
+    # the values a diff looks at, in one cheap to compare tuple
+    fingerprint: Tuple
 
     def __init__(self, guid: str, point_id: str, state: State, price: Decimal,
             max_power: float, connector_type: ConnectorType, image_url: Optional[str]=None):
-        self.guid = guid
-        self.point_id = point_id
+        self.guid = _intern(guid)
+        self.point_id = _intern(point_id)
         self.state = state
-        self.price = price
+        self.price = _intern_price(price)
         self.max_power = max_power
         self.connector_type = connector_type
-        self.image_url = image_url
+        self.image_url = _intern(image_url)
+        # points aren't changed once parsed, so this only needs doing once. The
+        # values themselves rather than a hash, so equal really means unchanged.
+        self.fingerprint = (self.price, connector_type, self.point_id, state, max_power)
 
 
 class Site:
-    
+
+    __slots__ = ('guid', 'name', 'address', 'town', 'county', 'postcode', 'country', 'lat', 'lng',
+        '_points', '__evcharge', '_points_fingerprint', '_fingerprinted_points')
+
     guid: str
     name: Optional[str]
     address: Optional[str]
@@ -58,17 +93,19 @@ class Site:
             town: Optional[str]=None, county: Optional[str]=None, postcode: Optional[str]=None,
             country: Optional[str]=None, lat: Optional[str]=None, lng: Optional[str]=None,
             points: Optional[List[Point]]=None, evcharge: Any=None):
-        self.guid = guid
+        self.guid = _intern(guid)
         self.name = name
         self.address = address
-        self.town = town
-        self.county = county
-        self.postcode = postcode
-        self.country = country
+        self.town = _intern(town)
+        self.county = _intern(county)
+        self.postcode = _intern(postcode)
+        self.country = _intern(country)
         self.lat = lat
         self.lng = lng
         self._points = points
         self.__evcharge = evcharge
+        self._points_fingerprint = None
+        self._fingerprinted_points = None
 
     @property
     def _evcharge(self):
@@ -88,6 +125,23 @@ class Site:
     async def refresh_points(self) -> None:
         self._points = await self._evcharge.get_site_points(self.guid)
 
+    @property
+    def fingerprint(self) -> Tuple:
+        """Equal only if the site's details and all of its points are. Points
+        are replaced on refresh rather than changed in place, so the
+        fingerprint of the points is kept until they are."""
+        points = self._points or {}
+        if self._fingerprinted_points is not points:
+            # a dict compares independently of the order the points were parsed or stored in
+            self._points_fingerprint = {guid: point.fingerprint for guid, point in points.items()}
+            self._fingerprinted_points = points
+        return (self._details_fingerprint, self._points_fingerprint)
+
+    @property
+    def _details_fingerprint(self) -> Tuple:
+        # built when needed rather than kept, as sites are held for a long time
+        return _site_details(self)
+
     def __str__(self) -> str:
         return self.guid
 
@@ -95,7 +149,7 @@ class Site:
         return self.guid == other.guid
 
     def copy(self) -> 'Site':
-        return Site(
+        copy = Site(
             self.guid,
             self.name,
             self.address,
@@ -105,9 +159,14 @@ class Site:
             self.country,
             self.lat,
             self.lng,
-            self.points,
-            self._evcharge
+            self._points,
+            # don't create a scraper just to copy a site
+            self.__evcharge
         )
+        # the points are shared, so their fingerprint can be too
+        copy._points_fingerprint = self._points_fingerprint
+        copy._fingerprinted_points = self._fingerprinted_points
+        return copy
 
 
 class SiteDiff:
@@ -116,43 +175,55 @@ class SiteDiff:
     old: Site
     new: Site
 
-    def __init__(self, old, new, differences: MutableMapping[str, Tuple[Any, Any]]):
+    def __init__(self, old, new, differences: Mapping[str, Any]):
         self.guid = old.guid
         self.old = old
         self.new = new
         self.__differences = differences
 
     @property
-    def differences(self) -> MutableMapping[str, Tuple[Any, Any]]:
-        return dict(self.__differences.items())
+    def differences(self) -> Mapping[str, Any]:
+        # read often by notifiers, so not copied; don't change it
+        return self.__differences
 
     def __bool__(self):
-        return len(self.differences) > 0
+        # 'points' is always present, but may be empty
+        return any(self.__differences.values())
 
     @classmethod
     def from_sites(cls, old_site: Site, new_site: Site):
         assert old_site.guid == new_site.guid
-        changed: MutableMapping[str, Tuple[Any, Any]] = {}
+        points_changed: MutableMapping[str, MutableMapping[str, Tuple[Any, Any]]] = {}
 
-        for attr in ('name', 'address', 'town', 'county', 'postcode', 'country', 'lat', 'lng'):
-            old = getattr(old_site, attr, None)
-            new = getattr(new_site, attr, None)
-            if old != new:
-                changed[attr] = (old, new)
+        if old_site.fingerprint == new_site.fingerprint:
+            # the usual case, nothing changed
+            return cls(old_site, new_site, {'points': points_changed})
 
-        old_points: Set[str] = set(old_site.points.keys())
-        new_points: Set[str] = set(new_site.points.keys())
+        changed: MutableMapping[str, Any] = {}
 
-        points_changed: MutableMapping[str, MutableMapping[str, Tuple[Any, Any]]] = {}
+        if old_site._details_fingerprint != new_site._details_fingerprint:
+            for attr in SITE_ATTRIBUTES:
+                old = getattr(old_site, attr, None)
+                new = getattr(new_site, attr, None)
+                if old != new:
+                    changed[attr] = (old, new)
+
+        old_points = old_site.points
+        new_points = new_site.points
+
+        for guid in (old_points.keys() | new_points.keys()):
+            old_point = old_points.get(guid)
+            new_point = new_points.get(guid)
+            if old_point is not None and new_point is not None and old_point.fingerprint == new_point.fingerprint:
+                continue
 
-        for guid in (old_points | new_points):
             point_diff = {}
-            for attr in ('price', 'connector_type', 'point_id', 'state', 'max_power'):
-                old = getattr(old_site.points.get(guid, None), attr, None)
-                new = getattr(new_site.points.get(guid, None), attr, None)
+            for attr in POINT_ATTRIBUTES:
+                old = getattr(old_point, attr, None)
+                new = getattr(new_point, attr, None)
                 if old != new:
                     point_diff[attr] = (old, new)
-            
+
             if point_diff:
                 points_changed[guid] = point_diff
 
@@ -1,5 +1,8 @@
+import asyncio
+import logging
 import os
-from typing import Optional, TextIO, Union
+import time
+from typing import Iterable, List, Optional, TextIO, Union
 import sys
 
 import aiofiles
@@ -9,59 +12,135 @@ from .const import CONNECTOR_TYPE_NAME, STATE_NAME
 from ..const import DEFAULT_ENCODING
 from ..models import ConnectorType, Site, SiteDiff
 
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
 class Notifier(NotifierType):
 
-    def __init__(self, file_path_or_writable: Optional[Union[str, TextIO]]=None, encoding: Optional[str]=None):
+    buffer_size: int
+    flush_interval: float
+    _buffer: List[str]
+
+    def __init__(self, file_path_or_writable: Optional[Union[str, TextIO]]=None, encoding: Optional[str]=None,
+            buffer_size: int=DEFAULT_BUFFER_SIZE, flush_interval: float=DEFAULT_FLUSH_INTERVAL):
         if file_path_or_writable is None:
             file_path_or_writable = sys.stdout
         self.file_path_or_writable = file_path_or_writable
         if encoding is None:
             encoding = DEFAULT_ENCODING
         self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._fh = None
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._flush_timer = None
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
 
     async def __aenter__(self):
+        if isinstance(self.file_path_or_writable, str):
+            # keep the file open for as long as we're in use, rather than once per write
+            self._fh = await aiofiles.open(self.file_path_or_writable, 'a+', encoding=self.encoding)
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        pass
+        await self.flush()
+        if self._fh is not None:
+            await self._fh.close()
+            self._fh = None
 
     async def write(self, message: str) -> int:
-        message = f'{message}{os.linesep}'
-        if isinstance(self.file_path_or_writable, str):
-            async with aiofiles.open(self.file_path_or_writable, 'a+', encoding=self.encoding) as fh:
-                return await fh.write(message)
-        else:
-            return self.file_path_or_writable.write(message)
+        return await self.write_lines([message])
+
+    async def write_lines(self, lines: Iterable[str]) -> int:
+        """Buffer some lines, flushing if the buffer is full or hasn't been flushed
+        for ``flush_interval`` seconds."""
+        text = ''.join(f'{line}{os.linesep}' for line in lines)
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+        elif self._flush_timer is None:
+            # make sure quiet periods don't leave output sitting in the buffer
+            self._flush_timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_later)
+        return len(text)
+
+    def _flush_later(self) -> None:
+        self._flush_timer = None
+        # keep hold of the task, so it isn't collected before it's done
+        self._flush_task = asyncio.ensure_future(self.flush())
+        self._flush_task.add_done_callback(self._flushed_later)
+
+    def _flushed_later(self, task: asyncio.Task) -> None:
+        if self._flush_task is task:
+            self._flush_task = None
+        if not task.cancelled() and task.exception() is not None:
+            # nobody is waiting on this task to see the error
+            logger.error('Failed to write buffered notifications', exc_info=task.exception())
+
+    async def flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+
+        text = ''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        # a timed flush may overlap with an explicit one; keep writes in order
+        async with self._flush_lock:
+            if self._fh is not None:
+                await self._fh.write(text)
+                await self._fh.flush()
+            elif isinstance(self.file_path_or_writable, str):
+                async with aiofiles.open(self.file_path_or_writable, 'a+', encoding=self.encoding) as fh:
+                    await fh.write(text)
+            else:
+                self.file_path_or_writable.write(text)
+                self.file_path_or_writable.flush()
 
     async def notify_changes(self, diff: SiteDiff) -> None:
         if not diff:
             return
 
+        lines = []
         # any changes to site metadata?
         if len(diff.differences) > 1 or 'points' not in diff.differences:
             for attribute, (old, new) in diff.differences.items():
                 if attribute == 'points':
                     continue
-                await self.write(f'{diff.old.name}: {attribute} changed from {str(old)} to {str(new)}')
+                lines.append(f'{diff.old.name}: {attribute} changed from {str(old)} to {str(new)}')
 
         if 'points' in diff.differences:
             for guid, point_changes in diff.differences['points'].items():
                 point_id = diff.old.points.get(guid, diff.new.points.get(guid)).point_id
                 for attribute, (old, new) in point_changes.items():
-                    await self.write(f'{point_id}: {attribute} changed from {str(old)} to {str(new)}')
+                    lines.append(f'{point_id}: {attribute} changed from {str(old)} to {str(new)}')
+
+        await self.write_lines(lines)
 
     async def notify_state(self, site: Site) -> None:
-        await self.write(f'* {site.name}')
-        await self.write(f'  {site.address}')
-        await self.write(f'  {site.town}')
-        await self.write(f'  {site.county}')
-        await self.write(f'  {site.postcode}')
-        await self.write(f'  {site.country}')
-        await self.write(f'  ({site.lat}, {site.lng})')
+        lines = [
+            f'* {site.name}',
+            f'  {site.address}',
+            f'  {site.town}',
+            f'  {site.county}',
+            f'  {site.postcode}',
+            f'  {site.country}',
+            f'  ({site.lat}, {site.lng})',
+        ]
         for point in site.points.values():
-            await self.write(f'  - {point.point_id}')
-            await self.write(f'    {STATE_NAME.get(point.state, point.state.value)}')
+            lines.append(f'  - {point.point_id}')
+            lines.append(f'    {STATE_NAME.get(point.state, point.state.value)}')
             if point.connector_type is not ConnectorType.UNKNOWN:
-                await self.write(f'    Connector: {CONNECTOR_TYPE_NAME.get(point.connector_type, point.connector_type.value)}')
-            await self.write(f'    {point.max_power} KWh')
-            await self.write(f'    £{point.price}/KWh')
\ No newline at end of file
+                lines.append(f'    Connector: {CONNECTOR_TYPE_NAME.get(point.connector_type, point.connector_type.value)}')
+            lines.append(f'    {point.max_power} KWh')
+            lines.append(f'    £{point.price}/KWh')
+        await self.write_lines(lines)
@@ -0,0 +1,40 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from .base import NotifierType
+from ..history import History
+from ..models import Site, SiteDiff
+
+
+class Notifier(NotifierType):
+    """Records every change to a ``History``, rather than telling anyone."""
+
+    history: History
+
+    def __init__(self, directory_or_history):
+        if isinstance(directory_or_history, History):
+            self.history = directory_or_history
+        else:
+            self.history = History(directory_or_history)
+        # file writes stay off the event loop, one at a time so rows stay in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-notifier')
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._run(self.history.close)
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def notify_changes(self, diff: SiteDiff) -> None:
+        # timestamped when seen, not when the write gets its turn
+        await self._run(self.history.record, diff, time.time())
+
+    async def notify_state(self, site: Site) -> None:
+        # only what the history doesn't already know, so restarts and state
+        # dumps don't add transitions which never happened
+        await self._run(self.history.record_state, site, time.time())
@@ -1,12 +1,14 @@
-import os
-from typing import Any, Optional, MutableMapping
+import asyncio
+from typing import Any, List, Optional, MutableMapping, Sequence, Tuple
 
 import aiohttp
 
 from .base import NotifierType
 from .const import CONNECTOR_TYPE_NAME, STATE_NAME
 from ..const import USER_AGENT
-from ..models import ConnectorType, Site, SiteDiff, State
+from ..models import ConnectorType, Point, Site, SiteDiff, State
+from ..sessions import SessionProvider
+from ..stores import StoreType
 
 
 DEFAULT_STATE_STYLE = None
@@ -17,29 +19,107 @@ STATE_STYLE = {
     State.UNKNOWN: DEFAULT_STATE_STYLE,
 }
 
+# https://api.slack.com/reference/block-kit/blocks
+MAX_BLOCKS = 50
+MAX_HEADER_LENGTH = 150
+MAX_SECTION_LENGTH = 3000
+# give up on a message if Slack keeps rate limiting it
+MAX_RATE_LIMITED_ATTEMPTS = 5
+DEFAULT_RETRY_AFTER = 1.0
+LAST_CHANGE_BLOCK_ID = "last_change"
+# chat.update errors which mean we should post a new status message instead
+UPDATE_GONE_ERRORS = frozenset({"message_not_found", "cant_update_message", "channel_not_found"})
+
 
 class Notifier(NotifierType):
 
     session: aiohttp.ClientSession
+    session_provider: SessionProvider
     channel_id: Optional[str]
     hook_url_or_bearer_token: str
     username: Optional[str]
     icon_emoji: Optional[str]
+    store: Optional[StoreType]
+    update_in_place: bool
+    _send_queue: Optional["asyncio.Queue[Tuple[MutableMapping[str, Any], str, asyncio.Future]]"]
+    _send_worker: Optional[asyncio.Task]
+    _status_blocks: MutableMapping[str, List[MutableMapping[str, Any]]]
+    _status_messages: MutableMapping[str, Optional[MutableMapping[str, Any]]]
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession(raise_for_status=True)
+        self.session = self.session_provider.session
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        await self.session.close()
+        if self._send_worker is not None:
+            await self._send_queue.join()
+            self._send_worker.cancel()
+            self._send_worker = None
+        if self._owns_session:
+            await self.session_provider.close()
 
-    def __init__(self, hook_url_or_bearer_token: str, channel_id: Optional[str]=None, icon_emoji: Optional[str]=None, username: Optional[str]=None):
+    def __init__(self, hook_url_or_bearer_token: str, channel_id: Optional[str]=None, icon_emoji: Optional[str]=None, username: Optional[str]=None,
+            session_provider: Optional[SessionProvider]=None, store: Optional[StoreType]=None,
+            update_in_place: bool=False):
+        # only close the session on exit if it isn't shared with anything else
+        self._owns_session = session_provider is None
+        self.session_provider = session_provider or SessionProvider()
         self.hook_url_or_bearer_token = hook_url_or_bearer_token
         self.channel_id = channel_id
-        self.icon_emoji = f':{icon_emoji}:' if icon_emoji[0] != ':' else icon_emoji
+        self.icon_emoji = f':{icon_emoji}:' if icon_emoji and icon_emoji[0] != ':' else icon_emoji
         self.username = username
+        self.store = store
+        self.update_in_place = update_in_place
+        self._send_queue = None
+        self._send_worker = None
+        self._status_blocks = {}
+        self._status_messages = {}
+
+    async def send(self, message: MutableMapping[str, Any], method: str="chat.postMessage") -> MutableMapping[str, Any]:
+        """Queue a message to be posted, and wait for it to be sent.
+
+        Messages are posted one at a time, in order, so that when Slack rate
+        limits us, everything waits for the period it asks for.
+        """
+        if self._send_worker is None:
+            self._send_queue = asyncio.Queue()
+            self._send_worker = asyncio.create_task(self._process_send_queue())
+        future = asyncio.get_running_loop().create_future()
+        await self._send_queue.put((message, method, future))
+        return await future
+
+    async def _process_send_queue(self):
+        while True:
+            message, method, future = await self._send_queue.get()
+            try:
+                result = await self._send_with_retry(message, method)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                self._send_queue.task_done()
+
+    async def _send_with_retry(self, message: MutableMapping[str, Any], method: str) -> MutableMapping[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                return await self._post(message, method)
+            except aiohttp.ClientResponseError as e:
+                attempt += 1
+                if e.status != 429 or attempt >= MAX_RATE_LIMITED_ATTEMPTS:
+                    raise
+                retry_after = DEFAULT_RETRY_AFTER
+                if e.headers and 'Retry-After' in e.headers:
+                    try:
+                        retry_after = float(e.headers['Retry-After'])
+                    except ValueError:
+                        pass
+                await asyncio.sleep(retry_after)
 
-    async def send(self, message: MutableMapping[str, Any]):
+    async def _post(self, message: MutableMapping[str, Any], method: str) -> MutableMapping[str, Any]:
         headers = {
             "User-Agent": USER_AGENT,
             "Content-Type": "application/json; charset=utf8",
@@ -50,15 +130,17 @@ class Notifier(NotifierType):
             url = self.hook_url_or_bearer_token
         else:
             headers["Authorization"] = f"Bearer {self.hook_url_or_bearer_token}"
-            url = "https://slack.com/api/chat.postMessage"
+            url = f"https://slack.com/api/{method}"
             if self.channel_id is not None:
-                message["channel"] = self.channel_id
-            if self.icon_emoji is not None:
-                message["icon_emoji"] = self.icon_emoji
-            if self.username is not None:
-                message["username"] = self.username
+                message.setdefault("channel", self.channel_id)
+            if method == "chat.postMessage":
+                if self.icon_emoji is not None:
+                    message["icon_emoji"] = self.icon_emoji
+                if self.username is not None:
+                    message["username"] = self.username
 
-        message["unfurl_links"] = False
+        if method == "chat.postMessage":
+            message["unfurl_links"] = False
 
         async with await self.session.post(
                 url,
@@ -66,10 +148,14 @@ class Notifier(NotifierType):
                 json=message
             ) as response:
 
+            if response.content_type != 'application/json':
+                # hooks reply with plain text
+                await response.read()
+                return {}
             data = await response.json()
             if not data.get('ok'):
                 raise RuntimeError(data['error'])
-            return response
+            return data
 
     async def notify_changes(self, diff: SiteDiff) -> None:
         if not diff:
@@ -78,77 +164,243 @@ class Notifier(NotifierType):
         # we only care about changes to points
         if 'points' not in diff.differences:
             return
-        
+
+        changes, with_price, with_details = self.describe_changes(diff)
+        if not changes:
+            return
+
+        site: Site = diff.new
+        if self.update_in_place:
+            return await self.update_status(site, changes, diff)
+
+        # one message per site per cycle, however many points changed
+        if len(changes) == 1:
+            heading, summary = changes[0], ()
+        else:
+            heading, summary = f"{len(changes)} changes at {site.name}", changes
+        message = self.build_message(
+            site, heading, with_price=with_price, with_connector_type=with_details,
+            with_max_power=with_details, summary=summary)
+        for part in self.split_message(message):
+            await self.send(part)
+
+    def _status_message_key(self, site: Site) -> str:
+        return f"slack:{self.channel_id}:{site.guid}"
+
+    async def _get_status_message(self, site: Site) -> Optional[MutableMapping[str, Any]]:
+        """The channel and timestamps of the message(s) showing a site's status."""
+        if site.guid not in self._status_messages:
+            key = self._status_message_key(site)
+            stored = None
+            if self.store is not None:
+                stored = (await self.store.get_metadata(key)).get(key)
+            self._status_messages[site.guid] = stored
+        return self._status_messages[site.guid]
+
+    async def _put_status_message(self, site: Site, status_message: MutableMapping[str, Any]) -> None:
+        self._status_messages[site.guid] = status_message
+        if self.store is not None:
+            await self.store.put_metadata({self._status_message_key(site): status_message})
+
+    def _status_message_blocks(self, site: Site, changes: Sequence[str]=(),
+            diff: Optional[SiteDiff]=None) -> List[MutableMapping[str, Any]]:
+        blocks = self._status_blocks.get(site.guid)
+        changed_points = diff.differences['points'] if diff is not None else {}
+        if (blocks is None or diff is None
+                or any(guid not in diff.old.points or guid not in site.points for guid in changed_points)):
+            heading = f"Current status of charge points at {site.name}"
+            blocks = self.build_message(
+                site, heading, with_price=True, with_connector_type=True, with_max_power=True)["blocks"]
+        else:
+            # only rebuild the sections for the points which changed
+            blocks = [
+                self.point_block(site, site.points[block["block_id"]], True, True, True)
+                if block.get("block_id") in changed_points else block
+                for block in blocks
+                if block.get("block_id") != LAST_CHANGE_BLOCK_ID
+            ]
+
+        if changes:
+            text = "\n".join(changes)
+            if len(text) > MAX_SECTION_LENGTH:
+                text = text[:MAX_SECTION_LENGTH - 1] + "…"
+            blocks.insert(1, {
+                "type": "context",
+                "block_id": LAST_CHANGE_BLOCK_ID,
+                "elements": [{"type": "mrkdwn", "text": text}],
+            })
+        self._status_blocks[site.guid] = blocks
+        return blocks
+
+    async def update_status(self, site: Site, changes: Sequence[str]=(), diff: Optional[SiteDiff]=None) -> None:
+        """Keep a single live status message per site, editing it with
+        ``chat.update`` rather than posting a new message every time."""
+        blocks = self._status_message_blocks(site, changes, diff)
+        parts = self.split_message({"blocks": blocks})
+        status_message = await self._get_status_message(site)
+        channel = status_message["channel"] if status_message else None
+        old_timestamps = status_message["ts"] if status_message else []
+        timestamps = []
+        for i, part in enumerate(parts):
+            if i < len(old_timestamps):
+                try:
+                    await self.send(dict(part, channel=channel, ts=old_timestamps[i]), "chat.update")
+                except RuntimeError as e:
+                    if str(e) not in UPDATE_GONE_ERRORS:
+                        raise
+                else:
+                    timestamps.append(old_timestamps[i])
+                    continue
+            data = await self.send(part)
+            channel = data["channel"]
+            timestamps.append(data["ts"])
+
+        # the status got shorter and needs fewer messages
+        for ts in old_timestamps[len(parts):]:
+            await self.send({"channel": channel, "ts": ts}, "chat.delete")
+
+        if timestamps != old_timestamps:
+            await self._put_status_message(site, {"channel": channel, "ts": timestamps})
+
+    @classmethod
+    def describe_changes(cls, diff: SiteDiff) -> Tuple[List[str], bool, bool]:
+        """Describe the changes to points in ``diff`` which are worth telling
+        anyone about, and whether prices and connector details are relevant."""
         site: Site = diff.new
         old_site: Site = diff.old
+        changes: List[str] = []
+        with_price = False
+        with_details = False
         for guid, point_changes in diff.differences['points'].items():
             point_id = old_site.points.get(guid, site.points.get(guid)).point_id
             if guid not in old_site.points:
-                await self.notify(site, f"New charge point, {point_id} added at {site.name}", with_price=True, with_connector_type=True, with_max_power=True)
+                changes.append(f"New charge point, {point_id} added at {site.name}")
+                with_price = with_details = True
+                continue
             if guid not in site.points:
-                await self.notify(f"Charge point {point_id} removed from {site.name}")
+                changes.append(f"Charge point {point_id} removed from {site.name}")
+                continue
             for attribute, (old, new) in point_changes.items():
                 if attribute == "price":
-                    await self.notify(site, f"Price changed for {point_id} at {site.name}", with_price=True)
+                    changes.append(f"Price changed for {point_id} at {site.name}")
+                    with_price = True
                 elif attribute == "state":
                     old: State
                     new: State
                     old_state_text: str = STATE_NAME.get(old, old.value)
                     new_state_text: str = STATE_NAME.get(new, new.value)
-                    await self.notify(site, f"Point {point_id} went from {old_state_text} to {new_state_text}.")
+                    changes.append(f"Point {point_id} went from {old_state_text} to {new_state_text}.")
                 # Not bothered about anything else
 
+        return changes, with_price, with_details
 
     async def notify_state(self, site: Site):
+        if self.update_in_place:
+            return await self.update_status(site)
         heading = f"Current status of charge points at {site.name}"
         return await self.notify(site, heading, with_price=True, with_connector_type=True, with_max_power=True)
 
 
     async def notify(self, site: Site, heading, with_price: bool=False, with_connector_type: bool=False, with_max_power: bool=False) -> None:
+        message = self.build_message(site, heading, with_price, with_connector_type, with_max_power)
+        for part in self.split_message(message):
+            await self.send(part)
+
+    @classmethod
+    def header_block(cls, heading: str) -> MutableMapping[str, Any]:
+        if len(heading) > MAX_HEADER_LENGTH:
+            heading = heading[:MAX_HEADER_LENGTH - 1] + "…"
+        return {
+            "type": "header",
+            "text": {
+                "type": "plain_text",
+                "text": heading
+            }
+        }
+
+    @classmethod
+    def summary_blocks(cls, lines: Sequence[str]) -> List[MutableMapping[str, Any]]:
+        blocks = []
+        text = ""
+        for line in lines:
+            line = f"• {line}"
+            if text and len(text) + len(line) + 1 > MAX_SECTION_LENGTH:
+                blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+                text = ""
+            text = f"{text}\n{line}" if text else line
+        if text:
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+        return blocks
+
+    @classmethod
+    def split_message(cls, message: MutableMapping[str, Any]) -> List[MutableMapping[str, Any]]:
+        """Split a message with more blocks than Slack allows into several,
+        each starting with a copy of the original header."""
+        blocks = message["blocks"]
+        if len(blocks) <= MAX_BLOCKS:
+            return [message]
+
+        header, body = blocks[0], blocks[1:]
+        suffix = " (continued)"
+        continued = cls.header_block(header["text"]["text"][:MAX_HEADER_LENGTH - len(suffix)] + suffix)
+        parts = []
+        while body:
+            chunk, body = body[:MAX_BLOCKS - 1], body[MAX_BLOCKS - 1:]
+            # don't start a message on a divider
+            if chunk[0]["type"] == "divider":
+                chunk = chunk[1:]
+            part = dict(message)
+            part["blocks"] = [continued if parts else header] + chunk
+            parts.append(part)
+        return parts
+
+    @classmethod
+    def build_message(cls, site: Site, heading, with_price: bool=False, with_connector_type: bool=False,
+            with_max_power: bool=False, summary: Sequence[str]=()) -> MutableMapping[str, Any]:
         message = {
-            "blocks": [
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": heading
-                    }
-                }
-            ]
+            "blocks": [cls.header_block(heading)] + cls.summary_blocks(summary)
         }
         for point in site.points.values():
-            connector_text = ""
-            price_text = ""
-            power_text = ""
-            if point.connector_type is not ConnectorType.UNKNOWN and with_connector_type:
-                connector_text = f"\n:electric-plug: {CONNECTOR_TYPE_NAME.get(point.connector_type, point.connector_type.value)}"
-            if with_price:
-                price_text = f"\n:pound: £{point.price}/KWh"
-            if with_max_power:
-                power_text = f"\n:zap: {point.max_power} KWh"
-
             message["blocks"].extend([
                 {
                     "type": "divider"
                 },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"*{point.point_id}*{connector_text}{power_text}{price_text}"
-                    },
-                    "accessory": {
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "text": STATE_NAME.get(point.state, point.state.value),
-                        },
-                        "url": f"https://evcharge.online/nologinpoints/{site.guid}",
-                    }
-                }
+                cls.point_block(site, point, with_price, with_connector_type, with_max_power)
             ])
-            state_style = STATE_STYLE.get(point.state, DEFAULT_STATE_STYLE)
-            if state_style:
-                message["blocks"][-1]["accessory"]["style"] = state_style
 
-        await self.send(message)
\ No newline at end of file
+        return message
+
+    @classmethod
+    def point_block(cls, site: Site, point: Point, with_price: bool=False, with_connector_type: bool=False,
+            with_max_power: bool=False) -> MutableMapping[str, Any]:
+        connector_text = ""
+        price_text = ""
+        power_text = ""
+        if point.connector_type is not ConnectorType.UNKNOWN and with_connector_type:
+            connector_text = f"\n:electric-plug: {CONNECTOR_TYPE_NAME.get(point.connector_type, point.connector_type.value)}"
+        if with_price:
+            price_text = f"\n:pound: £{point.price}/KWh"
+        if with_max_power:
+            power_text = f"\n:zap: {point.max_power} KWh"
+
+        block = {
+            "type": "section",
+            # lets an in-place update find the block for a point
+            "block_id": point.guid,
+            "text": {
+                "type": "mrkdwn",
+                "text": f"*{point.point_id}*{connector_text}{power_text}{price_text}"
+            },
+            "accessory": {
+                "type": "button",
+                "text": {
+                    "type": "plain_text",
+                    "text": STATE_NAME.get(point.state, point.state.value),
+                },
+                "url": f"https://evcharge.online/nologinpoints/{site.guid}",
+            }
+        }
+        state_style = STATE_STYLE.get(point.state, DEFAULT_STATE_STYLE)
+        if state_style:
+            block["accessory"]["style"] = state_style
+        return block
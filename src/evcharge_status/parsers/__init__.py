@@ -0,0 +1,26 @@
+import importlib
+import logging
+
+from .base import ParserType
+
+
+DEFAULT_PARSER = 'bs4'
+
+logger = logging.getLogger(__name__)
+
+
+def get_parser(name: str=DEFAULT_PARSER) -> ParserType:
+    if '.' in name:
+        # no, don't do that.
+        raise ValueError('Parser name may not contain "."')
+
+    module_name = f'.{name}'
+    try:
+        module = importlib.import_module(module_name, __package__)
+    except ImportError as e:
+        if name == DEFAULT_PARSER:
+            raise
+        # the backend's dependency isn't installed, fall back to the default
+        logger.warning('Parser %r is unavailable (%s), falling back to %r', name, e, DEFAULT_PARSER)
+        module = importlib.import_module(f'.{DEFAULT_PARSER}', __package__)
+    return module.parse_site_points
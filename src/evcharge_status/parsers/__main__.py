@@ -0,0 +1,47 @@
+"""Check that parser backends agree over saved nologinpoints pages.
+
+    python -m evcharge_status.parsers [--reference bs4] [--backend lxml] page.html [page.html ...]
+
+Exits non-zero if any backend produces different points to the reference.
+"""
+import argparse
+import sys
+
+from . import get_parser
+from .base import point_key
+from ..const import BASE_URL
+
+
+def compare(content: bytes, base_url: str, reference: str, backend: str) -> list:
+    expected = {guid: point_key(point) for guid, point in get_parser(reference)(content, base_url).items()}
+    actual = {guid: point_key(point) for guid, point in get_parser(backend)(content, base_url).items()}
+    return [
+        (guid, expected.get(guid), actual.get(guid))
+        for guid in sorted(expected.keys() | actual.keys())
+        if expected.get(guid) != actual.get(guid)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare parser backends over saved pages.')
+    parser.add_argument('pages', nargs='+', help='Saved nologinpoints HTML files.')
+    parser.add_argument('--reference', default='bs4')
+    parser.add_argument('--backend', action='append', help='Backend to compare. May be repeated.')
+    parser.add_argument('--base-url', default=f'{BASE_URL}nologinpoints/')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for page in args.pages:
+        with open(page, 'rb') as fh:
+            content = fh.read()
+        for backend in args.backend or ['lxml']:
+            mismatches = compare(content, args.base_url, args.reference, backend)
+            for guid, expected, actual in mismatches:
+                failed = True
+                print(f'{page}: {backend} differs for {guid}: expected {expected!r}, got {actual!r}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
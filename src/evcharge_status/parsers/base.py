@@ -0,0 +1,54 @@
+from decimal import Decimal
+import re
+from typing import Callable, MutableMapping, Optional, Tuple
+from urllib.parse import urljoin
+
+from ..models import ConnectorType, Point, State
+
+
+# very simplistic, does not parse arbitrary args
+JS_ARG_PARSER = re.compile(r'\s*\'([^\']+)\'\s*(?:,|\))')
+STRIP_WHITESPACE = re.compile(r'(^\s+|\s+$)', re.MULTILINE)
+
+ParserType = Callable[[bytes, str], MutableMapping[str, Point]]
+
+
+def make_point(on_click_js: str, state_text: str, connector_type_text: Optional[str],
+        image_src: Optional[str], base_url: str) -> Point:
+    """Build a Point from the raw values extracted from a point's markup, so that
+    every parser backend interprets them identically."""
+    # showPointDetails('UKEV1381', '720044004B004A00390072007000760032004F0031007600610054004800480031004E00540034004E0051003D003D00', '22', '0.1800', '1', 'False' )
+    # point, guid, kwh deliverable, cost, bill type, is vrm r
+    on_click_args = JS_ARG_PARSER.findall(on_click_js)
+    point_id = on_click_args[0]
+    guid = on_click_args[1]
+    max_power = float(on_click_args[2])
+    price = Decimal(on_click_args[3].rstrip('0'))
+    state_text = STRIP_WHITESPACE.sub('', state_text)
+    connector_type = ConnectorType.UNKNOWN
+    if connector_type_text is not None:
+        connector_type_text = STRIP_WHITESPACE.sub('', connector_type_text)
+        try:
+            connector_type = ConnectorType(connector_type_text)
+        except ValueError:
+            connector_type = ConnectorType.UNKNOWN
+    image_url = None
+    if image_src is not None:
+        image_url = urljoin(base_url, image_src)
+    try:
+        state = State(state_text)
+    except ValueError:
+        state = State.UNKNOWN
+    return Point(guid, point_id, state, price, max_power, connector_type=connector_type, image_url=image_url)
+
+
+def point_key(point: Point) -> Tuple:
+    return (
+        point.guid,
+        point.point_id,
+        point.state,
+        point.price,
+        point.max_power,
+        point.connector_type,
+        point.image_url,
+    )
@@ -0,0 +1,30 @@
+from typing import MutableMapping
+
+import bs4
+
+from .base import make_point
+from ..models import Point
+
+
+def parse_site_points(content: bytes, base_url: str) -> MutableMapping[str, Point]:
+    points = {}
+    soup = bs4.BeautifulSoup(content, features='html.parser')
+
+    base_tag = soup.find('base')
+    if base_tag:
+        base_url = base_tag['href']
+
+    for point_container in soup.select('.charg-list.site-details'):
+        point_row = point_container.find_parent(onclick=True)
+        connector_type_tag = point_container.select('.total-energy-icon + span.chrge-left')
+        image_tag = point_container.select('.chrge-site-img img')
+        point = make_point(
+            point_row.attrs['onclick'],
+            point_container.select('button')[0].text,
+            connector_type_tag[0].text if connector_type_tag else None,
+            image_tag[0]['src'] if image_tag else None,
+            base_url,
+        )
+        points[point.guid] = point
+
+    return points
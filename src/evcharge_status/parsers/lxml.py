@@ -0,0 +1,47 @@
+from typing import MutableMapping
+
+import lxml.etree
+import lxml.html
+
+from .base import make_point
+from ..models import Point
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# XPath equivalents of the CSS selectors used by the bs4 backend
+POINT_CONTAINERS = lxml.etree.XPath(f"//*[{_has_class('charg-list')} and {_has_class('site-details')}]")
+POINT_ROW = lxml.etree.XPath('ancestor::*[@onclick][1]')
+STATE_BUTTON = lxml.etree.XPath('.//button')
+CONNECTOR_TYPE = lxml.etree.XPath(
+    f".//*[{_has_class('total-energy-icon')}]/following-sibling::*[1][self::span and {_has_class('chrge-left')}]")
+IMAGE = lxml.etree.XPath(f".//*[{_has_class('chrge-site-img')}]//img")
+BASE_HREF = lxml.etree.XPath('//base/@href')
+
+
+def parse_site_points(content: bytes, base_url: str) -> MutableMapping[str, Point]:
+    points = {}
+    if not content.strip():
+        return points
+    document = lxml.html.fromstring(content)
+
+    base_href = BASE_HREF(document)
+    if base_href:
+        base_url = base_href[0]
+
+    for point_container in POINT_CONTAINERS(document):
+        point_row = POINT_ROW(point_container)[0]
+        connector_type_tag = CONNECTOR_TYPE(point_container)
+        image_tag = IMAGE(point_container)
+        point = make_point(
+            point_row.get('onclick'),
+            STATE_BUTTON(point_container)[0].text_content(),
+            connector_type_tag[0].text_content() if connector_type_tag else None,
+            image_tag[0].get('src') if image_tag else None,
+            base_url,
+        )
+        points[point.guid] = point
+
+    return points
@@ -0,0 +1,140 @@
+import asyncio
+import enum
+import random
+import time
+from typing import Callable, FrozenSet, Optional
+
+import aiohttp
+
+
+RETRYABLE_STATUSES: FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of making a request while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """Limits the average request rate to ``rate`` per second, allowing bursts of
+    up to ``capacity`` requests."""
+
+    rate: float
+    capacity: float
+
+    def __init__(self, rate: float, capacity: Optional[float]=None, clock: Callable[[], float]=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = self._clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            # unlimited
+            return
+
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for transient failures."""
+
+    retries: int
+    base_delay: float
+    max_delay: float
+
+    def __init__(self, retries: int=3, base_delay: float=0.5, max_delay: float=30.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, aiohttp.ClientResponseError):
+            return exc.status in RETRYABLE_STATUSES
+        return isinstance(exc, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+    def delay(self, attempt: int, exc: Optional[BaseException]=None) -> float:
+        retry_after = None
+        if isinstance(exc, aiohttp.ClientResponseError) and exc.headers:
+            retry_after = exc.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                # HTTP dates aren't worth the trouble, fall back to backoff
+                pass
+        # "full jitter"
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitState(enum.Enum):
+
+    CLOSED    = 'closed'
+    OPEN      = 'open'
+    HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """Stops requests for ``reset_timeout`` seconds after ``failure_threshold``
+    consecutive failures, then lets a single trial request through."""
+
+    failure_threshold: int
+    reset_timeout: float
+
+    def __init__(self, failure_threshold: int=5, reset_timeout: float=60.0, clock: Callable[[], float]=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self) -> CircuitState:
+        if self._opened_at is None:
+            return CircuitState.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return CircuitState.HALF_OPEN
+        return CircuitState.OPEN
+
+    def check(self) -> bool:
+        """Raises ``CircuitOpenError`` if a request shouldn't be sent. Returns
+        whether this request is the trial, which must be followed by
+        ``record_success``, ``record_failure`` or ``release``."""
+        state = self.state
+        if state is CircuitState.OPEN or (state is CircuitState.HALF_OPEN and self._trial_in_progress):
+            raise CircuitOpenError('Too many recent failures, not sending request')
+        if state is CircuitState.HALF_OPEN:
+            self._trial_in_progress = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Give up the trial without an outcome, e.g. when it was cancelled,
+        so another request can try."""
+        self._trial_in_progress = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            # disabled
+            return
+        self._failures += 1
+        if self._trial_in_progress or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+        self._trial_in_progress = False
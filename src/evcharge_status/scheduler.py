@@ -0,0 +1,76 @@
+import heapq
+import time
+from typing import Callable, Iterable, List, MutableMapping, Optional, Tuple
+
+from .models import Site, SiteDiff, State
+
+
+class Scheduler:
+    """Keeps a next-due time for each site in a priority queue.
+
+    Sites with points that are charging, or which changed on their last poll,
+    are polled every ``min_period`` seconds. Sites that are entirely idle or
+    offline back off by ``backoff`` each poll, up to ``max_period``.
+    """
+
+    min_period: float
+    max_period: float
+    backoff: float
+    _queue: List[Tuple[float, str]]
+    _intervals: MutableMapping[str, float]
+
+    def __init__(self, sites: Iterable[Site], min_period: float, max_period: float,
+            backoff: float=2.0, clock: Callable[[], float]=time.monotonic):
+        self.min_period = min_period
+        self.max_period = max(min_period, max_period)
+        self.backoff = backoff
+        self._clock = clock
+        self._queue = []
+        self._intervals = {}
+        now = self._clock()
+        for site in sites:
+            self.schedule(site.guid, now)
+
+    def schedule(self, guid: str, due: float, interval: Optional[float]=None) -> None:
+        if interval is None:
+            interval = self.min_period
+        self._intervals[guid] = interval
+        heapq.heappush(self._queue, (due, guid))
+
+    def is_busy(self, site: Site) -> bool:
+        return any(point.state is State.CHARGING for point in site.points.values())
+
+    def next_interval(self, site: Site, diff: Optional[SiteDiff]) -> float:
+        if diff or self.is_busy(site):
+            return self.min_period
+
+        previous = self._intervals.get(site.guid, self.min_period)
+        return min(previous * self.backoff, self.max_period)
+
+    def reschedule(self, site: Site, diff: Optional[SiteDiff]) -> float:
+        interval = self.next_interval(site, diff)
+        self.schedule(site.guid, self._clock() + interval, interval)
+        return interval
+
+    def pop_due(self) -> List[str]:
+        now = self._clock()
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue)[1])
+        return due
+
+    def time_until_next(self) -> float:
+        if not self._queue:
+            return self.max_period
+        return max(0.0, self._queue[0][0] - self._clock())
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def lag(self) -> float:
+        """How far behind schedule the most overdue site is, in seconds."""
+        if not self._queue:
+            return 0.0
+        return max(0.0, self._clock() - self._queue[0][0])
@@ -1,32 +1,56 @@
+import asyncio
 import datetime
-from decimal import Decimal
+import hashlib
 import json
-import re
-from typing import Any, Generator, MutableMapping
+from typing import Any, Generator, List, Mapping, MutableMapping, NamedTuple, Optional
 from urllib.parse import urljoin
 
 import aiohttp
-import bs4
 
 from .const import BASE_URL, USER_AGENT
-from .models import ConnectorType, Point, Site, State
+from .models import Point, Site
+from .parsers import DEFAULT_PARSER, get_parser
+from .resilience import CircuitBreaker, RetryPolicy, TokenBucket
+from .sessions import SessionProvider
 
 
-# very simplistic, does not parse arbitrary args
-JS_ARG_PARSER = re.compile(r'\s*\'([^\']+)\'\s*(?:,|\))')
-STRIP_WHITESPACE = re.compile(r'(^\s+|\s+$)', re.MULTILINE)
+class PageCacheEntry(NamedTuple):
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    digest: bytes
+    points: MutableMapping[str, Point]
 
 
 class EVCharge:
 
     session: aiohttp.ClientSession
+    session_provider: SessionProvider
+    rate_limiter: TokenBucket
+    retry_policy: RetryPolicy
+    circuit_breaker: CircuitBreaker
+    _page_cache: MutableMapping[str, PageCacheEntry]
+
+    def __init__(
+            self, parser: str=DEFAULT_PARSER, session_provider: Optional[SessionProvider]=None,
+            rate_limiter: Optional[TokenBucket]=None, retry_policy: Optional[RetryPolicy]=None,
+            circuit_breaker: Optional[CircuitBreaker]=None):
+        self._page_cache = {}
+        self.rate_limiter = rate_limiter or TokenBucket(0)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._parse_site_points = get_parser(parser)
+        # only close the session on exit if it isn't shared with anything else
+        self._owns_session = session_provider is None
+        self.session_provider = session_provider or SessionProvider()
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession(raise_for_status=True)
+        self.session = self.session_provider.session
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        await self.session.close()
+        if self._owns_session:
+            await self.session_provider.close()
 
     async def request(self, method: str, path: str, *args: Any, **kwargs: Any) -> aiohttp.ClientResponse:
         url = BASE_URL
@@ -34,11 +58,41 @@ class EVCharge:
             url = urljoin(f'{BASE_URL}', path)
         headers = kwargs.pop('headers', {})
         headers.setdefault('User-Agent', USER_AGENT)
-        return self.session.request(method, url, headers=headers, *args, **kwargs)
+
+        # once per request, so retries of one slow request don't trip the breaker
+        trial = self.circuit_breaker.check()
+        try:
+            attempt = 0
+            while True:
+                await self.rate_limiter.acquire()
+                try:
+                    response = await self.session.request(method, url, headers=headers, *args, **kwargs)
+                except Exception as e:
+                    if self.retry_policy.is_retryable(e):
+                        attempt += 1
+                        if attempt <= self.retry_policy.retries:
+                            await asyncio.sleep(self.retry_policy.delay(attempt, e))
+                            continue
+                        self.circuit_breaker.record_failure()
+                    elif isinstance(e, aiohttp.ClientResponseError):
+                        # e.g. a 404, the server is up, it just didn't like the request
+                        self.circuit_breaker.record_success()
+                    else:
+                        self.circuit_breaker.record_failure()
+                    raise
+                else:
+                    self.circuit_breaker.record_success()
+                    return response
+        finally:
+            if trial:
+                # cancelled, or anything else that skipped recording an outcome
+                self.circuit_breaker.release()
 
     async def login(self, username: str, password: str):
-        form_response = self.request('GET', './login')
-        async with await form_response:
+        # only needed here, and the lxml parser backend doesn't need it at all
+        import bs4
+
+        async with await self.request('GET', './login') as form_response:
             soup = bs4.BeautifulSoup(await form_response.read(), features='html.parser')
 
         csrf_token_tag = soup.find('input', name='__RequestVerificationToken')
@@ -47,7 +101,7 @@ class EVCharge:
 
         csrf_token = csrf_token_tag['value']
 
-        response = self.request('POST', './login', data={
+        response = await self.request('POST', './login', data={
             '__RequestVerificationToken': csrf_token,
             'EmailAddress': username,
             'Password': password,
@@ -56,11 +110,11 @@ class EVCharge:
             'CurrentLatitude': '',
             'CurrentLongitude': '',
         })
-        async with await response:
+        async with response:
             await response.read()
 
     async def search(self, key: str) -> Generator[Site, None, None]:
-        response = self.request('POST', './nologinsites', headers={'Content-Type': 'application/json'}, data=json.dumps({
+        response = await self.request('POST', './nologinsites', headers={'Content-Type': 'application/json'}, data=json.dumps({
             'CurrentLatitude': '52.06290',
             'CurrentLongitude': '-1.33978',
             'LocalDateTime': datetime.datetime.now().strftime(r'%Y-%m-%d %H:%M:%S'),
@@ -76,12 +130,16 @@ class EVCharge:
             'SearchKey': key
         }))
 
-        async with await response:
+        async with response:
             data = await response.json()
             # return data['MessagePoint'] - this is just a direct link to the GUID of the best matching site
 
-        for site in data.get('objSites', []):
-            yield Site(
+        for site in self.parse_sites(data):
+            yield site
+
+    def parse_sites(self, data: Mapping[str, Any]) -> List[Site]:
+        return [
+            Site(
                 site['RefGuid'],
                 site['SiteName'],
                 site['Address'],
@@ -94,47 +152,35 @@ class EVCharge:
                 {},
                 self,
             )
+            for site in data.get('objSites', [])
+        ]
 
     async def get_site_points(self, guid: str) -> MutableMapping[str, Point]:
-        points = {}
-        async with await self.request('GET', f'./nologinpoints/{guid}') as response:
-            soup = bs4.BeautifulSoup(await response.read(), features='html.parser')
-
-        for point_container in soup.select('.charg-list.site-details'):
-            point_row = point_container.find_parent(onclick=True)
-            on_click_js = point_row.attrs['onclick']
-            # showPointDetails('UKEV1381', '720044004B004A00390072007000760032004F0031007600610054004800480031004E00540034004E0051003D003D00', '22', '0.1800', '1', 'False' )
-            # point, guid, kwh deliverable, cost, bill type, is vrm r
-            on_click_args = JS_ARG_PARSER.findall(on_click_js)
-            point_id = on_click_args[0]
-            guid = on_click_args[1]
-            max_power = float(on_click_args[2])
-            price = Decimal(on_click_args[3].rstrip('0'))
-            state_text = STRIP_WHITESPACE.sub('', point_container.select('button')[0].text)
-            connector_type = ConnectorType.UNKNOWN
-            connector_type_tag = point_container.select('.total-energy-icon + span.chrge-left')
-            if connector_type_tag:
-                connector_type_text = STRIP_WHITESPACE.sub('', connector_type_tag[0].text)
-                try:
-                    connector_type = ConnectorType(connector_type_text)
-                except ValueError:
-                    connector_type = ConnectorType.UNKNOWN
+        cached = self._page_cache.get(guid)
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        async with await self.request('GET', f'./nologinpoints/{guid}', headers=headers) as response:
+            if response.status == 304 and cached is not None:
+                return dict(cached.points)
+            content = await response.read()
             base_url = str(response.url)
-            base_tag = soup.find('base')
-            if base_tag:
-                base_url = base_tag['href']
-
-            image_tag = point_container.select('.chrge-site-img img')
-            image_url = None
-            if image_tag:
-                image_url = urljoin(base_url, image_tag[0]['src'])
-            try:
-                state = State(state_text)
-            except ValueError:
-                state = State.UNKNOWN
-            points[guid] = Point(guid, point_id, state, price, max_power, connector_type=connector_type, image_url=image_url)
-
-        return points
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
 
+        digest = hashlib.sha1(content).digest()
+        if cached is not None and cached.digest == digest:
+            # the server doesn't support conditional requests, but the page is the same
+            points = cached.points
+        else:
+            points = self.parse_site_points(content, base_url)
 
+        self._page_cache[guid] = PageCacheEntry(etag, last_modified, digest, points)
+        return dict(points)
 
+    def parse_site_points(self, content: bytes, base_url: str) -> MutableMapping[str, Point]:
+        return self._parse_site_points(content, base_url)
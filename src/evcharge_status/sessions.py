@@ -0,0 +1,67 @@
+from typing import Optional
+
+import aiohttp
+
+
+class SessionProvider:
+    """Owns a single tuned aiohttp session which can be shared by the scraper and
+    notifiers, so connections (and TLS sessions) to each host are kept alive and
+    reused, and no single request can hang indefinitely.
+    """
+
+    limit: int
+    limit_per_host: int
+    keepalive_timeout: float
+    dns_cache_ttl: Optional[int]
+    total_timeout: Optional[float]
+    connect_timeout: Optional[float]
+    read_timeout: Optional[float]
+    _session: Optional[aiohttp.ClientSession]
+
+    def __init__(
+            self, limit: int=100, limit_per_host: int=10, keepalive_timeout: float=30.0,
+            dns_cache_ttl: Optional[int]=300, total_timeout: Optional[float]=60.0,
+            connect_timeout: Optional[float]=10.0, read_timeout: Optional[float]=30.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.total_timeout = total_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._session = None
+
+    async def __aenter__(self):
+        self.session
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=self.dns_cache_ttl is not None,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=self.total_timeout,
+                connect=self.connect_timeout,
+                sock_read=self.read_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                raise_for_status=True,
+            )
+
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
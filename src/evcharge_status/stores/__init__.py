@@ -1,5 +1,5 @@
 import importlib
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
 from .base import StoreType
 
@@ -14,6 +14,20 @@ def get_store(uri: str) -> StoreType:
         # no, don't do that.
         raise ValueError('Store scheme may not contain "."')
 
+    options = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+    if '+' in scheme:
+        # a wrapper around another store, e.g. cache+file:///path?cache_size=10
+        wrapper, _, inner_scheme = scheme.partition('+')
+        prefix = f'{wrapper}_'
+        wrapper_options = {k[len(prefix):]: v for k, v in options.items() if k.startswith(prefix)}
+        inner_query = urlencode({k: v for k, v in options.items() if not k.startswith(prefix)})
+        inner = get_store(urlunparse(parts._replace(scheme=inner_scheme, query=inner_query)))
+        module = importlib.import_module(f'.{wrapper}', __package__)
+        return module.Store(inner, **wrapper_options)
+
     module_name = f'.{scheme}'
     module = importlib.import_module(module_name, __package__)
-    return module.Store(parts.path, **{k: v[-1] for k, v in parse_qs(parts.query)})
\ No newline at end of file
+    # allow both scheme://name and scheme:///path
+    location = f'{parts.netloc}{parts.path}'
+    return module.Store(location, **options)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from abc import ABCMeta
-from typing import Generator, List
+from typing import Any, Generator, List, Mapping
 
 from ..models import Site
 
@@ -10,4 +10,20 @@ class StoreType(metaclass=ABCMeta):
         return NotImplemented
 
     async def put_sites(self, *sites: Site) -> List[Site]:
-        return NotImplemented
\ No newline at end of file
+        return NotImplemented
+
+    async def flush(self) -> None:
+        """Write out anything that has been buffered."""
+        pass
+
+    async def close(self) -> None:
+        """Release any resources, and finish any outstanding writes."""
+        pass
+
+    async def get_metadata(self, *keys: str) -> Mapping[str, Any]:
+        """Get small JSON-compatible values stored alongside sites, such as
+        references to notification messages. Missing keys are omitted."""
+        return NotImplemented
+
+    async def put_metadata(self, values: Mapping[str, Any]) -> None:
+        return NotImplemented
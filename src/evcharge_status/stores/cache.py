@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import time
+from typing import Any, Callable, Generator, List, Mapping, Tuple
+
+from .base import StoreType
+from ..models import Site
+
+
+DEFAULT_SIZE = 1024
+DEFAULT_TTL = 300.0
+
+
+class Store(StoreType):
+    """Read-through cache of parsed sites in front of another store.
+
+    Selected with a ``cache+`` prefix on the inner store's URI, e.g.
+    ``cache+file:///var/lib/evcharge/site.json?cache_size=500&cache_ttl=60``.
+    Sites are kept in a least-recently-used map of up to ``size`` entries, each
+    for at most ``ttl`` seconds. Puts go straight through to the inner store
+    and then replace the cached entries. Like any other store, callers get
+    their own copies, so refreshing one doesn't change what's cached.
+    """
+
+    store: StoreType
+    size: int
+    ttl: float
+    hits: int
+    misses: int
+    _sites: 'OrderedDict[str, Tuple[float, Site]]'
+
+    def __init__(self, store: StoreType, size: Any=DEFAULT_SIZE, ttl: Any=DEFAULT_TTL,
+            clock: Callable[[], float]=time.monotonic):
+        self.store = store
+        # these may come from a query string
+        self.size = int(size)
+        self.ttl = float(ttl)
+        self._clock = clock
+        self._sites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, guid: str) -> Site:
+        entry = self._sites.get(guid)
+        if entry is None:
+            return None
+        expires, site = entry
+        if expires < self._clock():
+            del self._sites[guid]
+            return None
+        self._sites.move_to_end(guid)
+        return site
+
+    def _set(self, site: Site) -> None:
+        self._sites[site.guid] = (self._clock() + self.ttl, site.copy())
+        self._sites.move_to_end(site.guid)
+        while len(self._sites) > self.size:
+            self._sites.popitem(last=False)
+
+    def invalidate(self, *site_guids: str) -> None:
+        if not site_guids:
+            self._sites.clear()
+        for guid in site_guids:
+            self._sites.pop(guid, None)
+
+    async def get_sites(self, *site_guids: str) -> Generator[Site, None, None]:
+        if not site_guids:
+            # can't know what we're missing, so read everything
+            async for site in self.store.get_sites():
+                self._set(site)
+                yield site
+            return
+
+        missing = []
+        for guid in site_guids:
+            site = self._get(guid)
+            if site is None:
+                missing.append(guid)
+                continue
+            self.hits += 1
+            yield site.copy()
+
+        if missing:
+            self.misses += len(missing)
+            async for site in self.store.get_sites(*missing):
+                self._set(site)
+                yield site
+
+    async def put_sites(self, *sites: Site) -> List[Site]:
+        try:
+            result = await self.store.put_sites(*sites)
+        except Exception:
+            # we don't know what made it to the store
+            self.invalidate(*[site.guid for site in sites])
+            raise
+        for site in sites:
+            self._set(site)
+        return result
+
+    async def get_metadata(self, *keys: str) -> Mapping[str, Any]:
+        return await self.store.get_metadata(*keys)
+
+    async def put_metadata(self, values: Mapping[str, Any]) -> None:
+        await self.store.put_metadata(values)
+
+    async def flush(self) -> None:
+        await self.store.flush()
+
+    async def close(self) -> None:
+        await self.store.close()
@@ -1,19 +1,28 @@
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+import hashlib
+import json
+import logging
+import math
+import random
 import time
-from typing import Any, Generator, List, Mapping, MutableMapping
-
-import boto3
+from typing import Any, Generator, List, Mapping, MutableMapping, Optional, Sequence, Union
 
 from .base import StoreType
-from ..models import ConnectorType, Point, Site, State, Union
+from ..models import ConnectorType, Point, Site, State
 
 # Design note:
 # Using conditional writes charges you for a write even if it doesn't result in an update,
 # so we do a separate read and then decide whether we want to write back or not. Conditional
 # writes are useful for isolation, but not efficiency.
 #
+# The read only projects the fingerprints of each site and its points. If the site's
+# fingerprint is unchanged, it isn't written at all. If only a few points changed, only
+# those entries of the points map are SET/REMOVEd with UpdateItem. Note that UpdateItem is
+# still billed on the size of the whole item, so that saves bandwidth rather than write
+# units; only skipped writes are counted in write_units_saved.
+#
 # Schema:
 #
 # site_guid: S (PK)
@@ -36,6 +45,16 @@ from ..models import ConnectorType, Point, Site, State, Union
 #   }
 # }
 # last_checked: N
+# fingerprint: S
+# details_fingerprint: S
+# point_fingerprints: M {
+#   point_guid: S
+# }
+#
+# Metadata items share the table, keyed by a prefix which can't be a site GUID:
+#
+# site_guid: S (PK) "_metadata#<key>"
+# value: S (JSON)
 
 DynamoDBItem = Mapping[str, Mapping[str, Union[bool, float, int, List['DynamoDBItem'], Mapping[str, 'DynamoDBItem'], None, str]]]
 
@@ -59,20 +78,105 @@ class Field:
     POINT_MAX_POWER = 'max_power'
     POINT_CONNECTOR_TYPE = 'connector_type'
     POINT_IMAGE_URL = 'image_url'
+    METADATA_VALUE = 'value'
+    SITE_FINGERPRINT = 'fingerprint'
+    SITE_DETAILS_FINGERPRINT = 'details_fingerprint'
+    SITE_POINT_FINGERPRINTS = 'point_fingerprints'
+
+
+METADATA_PREFIX = '_metadata#'
+
+
+# https://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchGetItem.html
+MAX_BATCH_GET_KEYS = 100
+# https://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchWriteItem.html
+MAX_BATCH_WRITE_ITEMS = 25
+UNPROCESSED_BASE_DELAY = 0.05
+UNPROCESSED_MAX_DELAY = 5.0
+UNPROCESSED_MAX_ATTEMPTS = 8
+# above this fraction of points changed, just rewrite the whole item
+MAX_PARTIAL_UPDATE_FRACTION = 0.5
+WRITE_UNIT_BYTES = 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _string(value: Optional[str]) -> DynamoDBItem:
+    if value is None:
+        return {'NULL': True}
+    return {'S': value}
+
+
+def _chunks(items: Sequence[Any], size: int) -> Generator[Sequence[Any], None, None]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def _backoff(attempt: int) -> None:
+    if attempt >= UNPROCESSED_MAX_ATTEMPTS:
+        raise RuntimeError('DynamoDB did not process all items after repeated attempts')
+    await asyncio.sleep(random.uniform(0, min(UNPROCESSED_MAX_DELAY, UNPROCESSED_BASE_DELAY * 2 ** attempt)))
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _write_units(item: DynamoDBItem) -> int:
+    # an approximation; DynamoDB counts attribute names and values, not JSON
+    return max(1, math.ceil(len(json.dumps(item)) / WRITE_UNIT_BYTES))
 
 
 class Store(StoreType):
 
     table_name: str
+    writes_skipped: int
+    partial_updates: int
+    full_writes: int
+    write_units_saved: int
+
+    def __init__(self, table_name: str, region_name: Optional[str]=None, endpoint_url: Optional[str]=None,
+            max_pool_connections: Any=10):
+        # endpoint_url allows a local stand-in, e.g. dynamodb://sites?endpoint_url=http://localhost:8000
+        # boto3 takes a while to import, so only pay for it when this store is used
+        import boto3
+        import botocore.config
 
-    def __init__(self, table_name: str):
-        self.client = boto3.client('dynamodb')
+        max_pool_connections = int(max_pool_connections)
+        self.client = boto3.client(
+            'dynamodb',
+            region_name=region_name,
+            endpoint_url=endpoint_url,
+            config=botocore.config.Config(max_pool_connections=max_pool_connections),
+        )
         self.table_name = table_name
+        # boto3 clients are thread safe, so share one, and a pool of threads to call it from
+        self._executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix='dynamodb-store')
+        self.writes_skipped = 0
+        self.partial_updates = 0
+        self.full_writes = 0
+        self.write_units_saved = 0
+
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    def _log_writes(self, level: int, prefix: str, skipped: int, partial: int, full: int, units_saved: int) -> None:
+        logger.log(
+            level, '%s: %d unchanged sites skipped, %d partly updated, %d written in full, ~%d write units saved',
+            prefix, skipped, partial, full, units_saved)
+
+    async def close(self) -> None:
+        self._log_writes(
+            logging.INFO, f'DynamoDB table {self.table_name}', self.writes_skipped, self.partial_updates,
+            self.full_writes, self.write_units_saved)
+        # waiting for the pool's threads to finish would block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
 
     @classmethod
     def parse_site(cls, item: DynamoDBItem) -> Site:
         points = {}
-        for point_guid, point_data in item.get(Field.SITE_POINTS, {}).get('M', {}).items():
+        for point_guid, point_value in item.get(Field.SITE_POINTS, {}).get('M', {}).items():
+            point_data = point_value.get('M', {})
             # shouldn't need to account for bad state values in the table, but just in case
             state_text = point_data.get(Field.POINT_STATE, {}).get('S')
             try:
@@ -86,10 +190,11 @@ class Store(StoreType):
             except ValueError:
                 connector_type = ConnectorType.UNKNOWN
             points[point_guid] = Point(
+                point_guid,
                 point_data.get(Field.POINT_ID, {}).get('S'),
                 state,
                 Decimal(point_data.get(Field.POINT_PRICE, {}).get('S', '0')),
-                point_data.get(Field.POINT_MAX_POWER, {}).get('N', 0),
+                float(point_data.get(Field.POINT_MAX_POWER, {}).get('N', 0)),
                 connector_type,
                 point_data.get(Field.POINT_IMAGE_URL, {}).get('S', None)
             )
@@ -119,110 +224,247 @@ class Store(StoreType):
                 'S': str(point.price)
             },
             Field.POINT_MAX_POWER: {
-                'N': point.max_power
+                'N': str(point.max_power)
             },
             Field.POINT_CONNECTOR_TYPE: {
                 'S': point.connector_type.value
             },
-            Field.POINT_IMAGE_URL: {
-                'S': point.image_url
-            }
+            Field.POINT_IMAGE_URL: _string(point.image_url)
         }
 
     @classmethod
     def format_site(self, site: Site) -> DynamoDBItem:
         points_data: MutableMapping[str, DynamoDBItem] = {
-            point.guid: self.format_point(point)
-            for point in site.points
+            point.guid: {
+                'M': self.format_point(point)
+            }
+            for point in site.points.values()
+        }
+        point_fingerprints = {
+            guid: _digest(point_data['M'])
+            for guid, point_data in points_data.items()
         }
         return {
             Field.SITE_GUID: {
                 'S': site.guid
             },
-            Field.SITE_NAME: {
-                'S': site.name
-            },
-            Field.SITE_ADDRESS: {
-                'S': site.address
-            },
-            Field.SITE_TOWN: {
-                'S': site.town
-            },
-            Field.SITE_COUNTY: {
-                'S': site.county
-            },
-            Field.SITE_POSTCODE: {
-                'S': site.postcode
-            },
-            Field.SITE_COUNTRY: {
-                'S': site.country
-            },
-            Field.SITE_LAT: {
-                'S': site.lat
-            },
-            Field.SITE_LNG: {
-                'S': site.lng
-            },
+            Field.SITE_NAME: _string(site.name),
+            Field.SITE_ADDRESS: _string(site.address),
+            Field.SITE_TOWN: _string(site.town),
+            Field.SITE_COUNTY: _string(site.county),
+            Field.SITE_POSTCODE: _string(site.postcode),
+            Field.SITE_COUNTRY: _string(site.country),
+            Field.SITE_LAT: _string(site.lat),
+            Field.SITE_LNG: _string(site.lng),
             Field.SITE_POINTS: {
                 'M': points_data
             },
             Field.SITE_CHECKED: {
-                'N': time.time()
+                'N': str(time.time())
+            },
+            Field.SITE_FINGERPRINT: {
+                'S': self.fingerprint_site(site, point_fingerprints)
+            },
+            Field.SITE_DETAILS_FINGERPRINT: {
+                'S': self.fingerprint_site_details(site)
+            },
+            Field.SITE_POINT_FINGERPRINTS: {
+                'M': {
+                    guid: {'S': fingerprint}
+                    for guid, fingerprint in point_fingerprints.items()
+                }
             }
         }
 
-    def _get_sites(self, *site_guids: str) -> Generator[Site, None, None]:
-        unprocessed_keys = [
-            {
-                Field.SITE_GUID: {
-                    'S': site_guid
-                }
-            } for site_guid in site_guids
-        ]
-        while unprocessed_keys:
-            response = self.client.batch_get_item(
-                RequestItems={
-                    self.table_name: {
-                        'Keys': unprocessed_keys
-                    }
-                }
-            )
-            for result in response['Responses'][self.table_name]:
-                yield self.parse_site(result)
+    @classmethod
+    def fingerprint_point(cls, point: Point) -> str:
+        return _digest(cls.format_point(point))
 
-            unprocessed_keys = result['UnprocessedKeys'][self.table_name]['Keys']
+    @classmethod
+    def fingerprint_site_details(cls, site: Site) -> str:
+        return _digest([getattr(site, field) for field in (
+            'guid', 'name', 'address', 'town', 'county', 'postcode', 'country', 'lat', 'lng')])
+
+    @classmethod
+    def fingerprint_site(cls, site: Site, point_fingerprints: Optional[Mapping[str, str]]=None) -> str:
+        if point_fingerprints is None:
+            point_fingerprints = {guid: cls.fingerprint_point(point) for guid, point in site.points.items()}
+        return _digest({
+            'site': cls.fingerprint_site_details(site),
+            'points': point_fingerprints,
+        })
+
+    async def _batch_get(self, site_guids: Sequence[str], **kwargs: Any) -> Generator[DynamoDBItem, None, None]:
+        # items are yielded as each page arrives, rather than once everything is read
+        for chunk in _chunks(site_guids, MAX_BATCH_GET_KEYS):
+            request_items = {
+                self.table_name: dict(
+                    Keys=[{Field.SITE_GUID: {'S': site_guid}} for site_guid in chunk],
+                    **kwargs
+                )
+            }
+            attempt = 0
+            while request_items:
+                response = await self._run(self.client.batch_get_item, RequestItems=request_items)
+                for result in response.get('Responses', {}).get(self.table_name, []):
+                    yield result
+
+                request_items = response.get('UnprocessedKeys')
+                if request_items:
+                    await _backoff(attempt)
+                    attempt += 1
+
+    async def _scan(self) -> Generator[DynamoDBItem, None, None]:
+        # every site, a page at a time, leaving out metadata items
+        kwargs = dict(
+            TableName=self.table_name,
+            FilterExpression='NOT begins_with(#guid, :metadata)',
+            ExpressionAttributeNames={'#guid': Field.SITE_GUID},
+            ExpressionAttributeValues={':metadata': {'S': METADATA_PREFIX}},
+        )
+        while True:
+            response = await self._run(self.client.scan, **kwargs)
+            for item in response.get('Items', []):
+                yield item
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
     async def get_sites(self, *site_guids: str) -> Generator[Site, None, None]:
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(self._get_sites(*site_guids))
-            async for site in asyncio.wrap_future(future):
-                yield site
-
-    def _put_sites(self, *sites: Site) -> List[Site]:
-        results = []
-        unprocessed_items = [
-            {
-                'PutRequest': {
-                    'Item': self.format_site(site)
-                }
-            } for site in sites
-        ]
-        while unprocessed_items:
-            response = self.client.batch_put_item(
-                RequestItems={
-                    self.table_name: unprocessed_items
-                }
-            )
-            for result in response['Responses'][self.table_name]:
-                # don't use a generator, otherwise if the results aren't read, any remaining
-                # unprocessed items won't be processed
-                results.append(self.parse_site(result))
+        # like the other stores, no GUIDs means every site
+        items = self._batch_get(site_guids) if site_guids else self._scan()
+        async for item in items:
+            yield self.parse_site(item)
 
-            unprocessed_items = result['UnprocessedItems'][self.table_name]
+    async def _get_fingerprints(self, *site_guids: str) -> Mapping[str, DynamoDBItem]:
+        fingerprints = {}
+        async for item in self._batch_get(
+                site_guids,
+                ProjectionExpression='#guid, #fingerprint, #details_fingerprint, #point_fingerprints',
+                ExpressionAttributeNames={
+                    '#guid': Field.SITE_GUID,
+                    '#fingerprint': Field.SITE_FINGERPRINT,
+                    '#details_fingerprint': Field.SITE_DETAILS_FINGERPRINT,
+                    '#point_fingerprints': Field.SITE_POINT_FINGERPRINTS,
+                }):
+            fingerprints[item[Field.SITE_GUID]['S']] = item
+        return fingerprints
 
-        return results
+    def _update_points(self, site: Site, item: DynamoDBItem, changed: Sequence[str], removed: Sequence[str]) -> None:
+        names = {
+            '#points': Field.SITE_POINTS,
+            '#point_fingerprints': Field.SITE_POINT_FINGERPRINTS,
+            '#fingerprint': Field.SITE_FINGERPRINT,
+            '#checked': Field.SITE_CHECKED,
+        }
+        values = {
+            ':fingerprint': item[Field.SITE_FINGERPRINT],
+            ':checked': item[Field.SITE_CHECKED],
+        }
+        sets = ['#fingerprint = :fingerprint', '#checked = :checked']
+        removes = []
+        for i, guid in enumerate(changed):
+            names[f'#p{i}'] = guid
+            values[f':p{i}'] = item[Field.SITE_POINTS]['M'][guid]
+            values[f':f{i}'] = item[Field.SITE_POINT_FINGERPRINTS]['M'][guid]
+            sets.append(f'#points.#p{i} = :p{i}')
+            sets.append(f'#point_fingerprints.#p{i} = :f{i}')
+        for i, guid in enumerate(removed):
+            names[f'#r{i}'] = guid
+            removes.append(f'#points.#r{i}')
+            removes.append(f'#point_fingerprints.#r{i}')
+        expression = f'SET {", ".join(sets)}'
+        if removes:
+            expression += f' REMOVE {", ".join(removes)}'
+        self.client.update_item(
+            TableName=self.table_name,
+            Key={Field.SITE_GUID: {'S': site.guid}},
+            UpdateExpression=expression,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
 
     async def put_sites(self, *sites: Site) -> List[Site]:
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(self._put_sites(*sites))
-            await asyncio.wrap_future(future)
\ No newline at end of file
+        existing = await self._get_fingerprints(*[site.guid for site in sites])
+        full_writes = []
+        partial_updates = []
+        skipped = 0
+        units_saved = 0
+        for site in sites:
+            item = self.format_site(site)
+            stored = existing.get(site.guid)
+            if stored is None or Field.SITE_POINT_FINGERPRINTS not in stored:
+                full_writes.append(item)
+                continue
+            if stored.get(Field.SITE_FINGERPRINT) == item[Field.SITE_FINGERPRINT]:
+                skipped += 1
+                units_saved += _write_units(item)
+                continue
+
+            old_points = {guid: value['S'] for guid, value in stored[Field.SITE_POINT_FINGERPRINTS]['M'].items()}
+            new_points = {guid: value['S'] for guid, value in item[Field.SITE_POINT_FINGERPRINTS]['M'].items()}
+            changed = [guid for guid, fingerprint in new_points.items() if old_points.get(guid) != fingerprint]
+            removed = [guid for guid in old_points if guid not in new_points]
+            details_unchanged = stored.get(Field.SITE_DETAILS_FINGERPRINT) == item[Field.SITE_DETAILS_FINGERPRINT]
+            if details_unchanged and len(changed) + len(removed) <= len(new_points) * MAX_PARTIAL_UPDATE_FRACTION:
+                partial_updates.append((site, item, changed, removed))
+            else:
+                full_writes.append(item)
+
+        await asyncio.gather(*[
+            self._run(self._update_points, *partial_update)
+            for partial_update in partial_updates
+        ])
+        self.partial_updates += len(partial_updates)
+
+        for chunk in _chunks(full_writes, MAX_BATCH_WRITE_ITEMS):
+            request_items = {
+                self.table_name: [
+                    {
+                        'PutRequest': {
+                            'Item': item
+                        }
+                    } for item in chunk
+                ]
+            }
+            attempt = 0
+            while request_items:
+                response = await self._run(self.client.batch_write_item, RequestItems=request_items)
+                request_items = response.get('UnprocessedItems')
+                if request_items:
+                    await _backoff(attempt)
+                    attempt += 1
+        self.full_writes += len(full_writes)
+        self.writes_skipped += skipped
+        self.write_units_saved += units_saved
+        self._log_writes(
+            logging.DEBUG, f'Put {len(sites)} sites', skipped, len(partial_updates), len(full_writes), units_saved)
+
+        return list(sites)
+
+    def _get_metadata(self, *keys: str) -> Mapping[str, Any]:
+        values = {}
+        for key in keys:
+            response = self.client.get_item(
+                TableName=self.table_name,
+                Key={Field.SITE_GUID: {'S': f'{METADATA_PREFIX}{key}'}}
+            )
+            if 'Item' in response:
+                values[key] = json.loads(response['Item'][Field.METADATA_VALUE]['S'])
+        return values
+
+    async def get_metadata(self, *keys: str) -> Mapping[str, Any]:
+        return await self._run(self._get_metadata, *keys)
+
+    def _put_metadata(self, values: Mapping[str, Any]) -> None:
+        for key, value in values.items():
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    Field.SITE_GUID: {'S': f'{METADATA_PREFIX}{key}'},
+                    Field.METADATA_VALUE: {'S': json.dumps(value)},
+                }
+            )
+
+    async def put_metadata(self, values: Mapping[str, Any]) -> None:
+        await self._run(self._put_metadata, values)
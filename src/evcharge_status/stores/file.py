@@ -1,3 +1,5 @@
+import asyncio
+from decimal import Decimal
 import json
 import time
 from typing import Any, Generator, List, Mapping, Union
@@ -10,11 +12,16 @@ from ..models import ConnectorType, Point, Site, State
 
 JSONType = Union[bool, float, int, List['JSONType'], Mapping[str, 'JSONType'], None, str]
 
+# top level key for values which aren't sites
+METADATA_KEY = '_metadata'
+
 
 class Store(StoreType):
 
     def __init__(self, file_path: str):
         self.file_path = file_path
+        # the whole file is rewritten on each put, so don't let operations interleave
+        self._lock = asyncio.Lock()
 
     @classmethod
     def format_point(self, point: Point) -> JSONType:
@@ -46,7 +53,7 @@ class Store(StoreType):
     @classmethod
     def parse_site(self, site: JSONType) -> Site:
         points = {}
-        for guid, point in site.get('points', []).items():
+        for guid, point in site.get('points', {}).items():
             state_text = point.get("state")
             try:
                 state = State(state_text)
@@ -57,15 +64,15 @@ class Store(StoreType):
                 connector_type = ConnectorType(connector_type_text)
             except ValueError:
                 connector_type = ConnectorType.UNKNOWN
-            points.append(Point(
+            points[guid] = Point(
                 guid,
                 point.get("point_id"),
                 state,
-                point.get("price"),
+                Decimal(point.get("price", '0')),
                 point.get("max_power"),
                 connector_type,
                 point.get("image_url"),
-            ))
+            )
         return Site(
             site.get('guid'),
             site.get('name'),
@@ -87,25 +94,47 @@ class Store(StoreType):
                 await fh.write(json.dumps({}))
 
     async def get_sites(self, *site_guids: str) -> Generator[Site, None, None]:
-        await self._init_store()
-        async with aiofiles.open(self.file_path, 'r') as fh:
-            data = json.loads(await fh.read())
+        async with self._lock:
+            await self._init_store()
+            async with aiofiles.open(self.file_path, 'r') as fh:
+                data = json.loads(await fh.read())
 
-        async for site in data:
+        for guid, site in data.items():
+            if guid == METADATA_KEY or (site_guids and guid not in site_guids):
+                continue
             yield self.parse_site(site)
-    
+
     async def put_sites(self, *sites: Site) -> List[Site]:
         sites_data = {
             site.guid: self.format_site(site)
             for site in sites
         }
-        await self._init_store()
-        async with aiofiles.open(self.file_path, 'r+') as fh:
-            await fh.seek(0)
-            existing_data = json.loads(await fh.read())
-            await fh.seek(0)
-            await fh.truncate(0)
-            existing_data.update(sites_data)
-            await fh.write(json.dumps(existing_data))
-
-        return sites
\ No newline at end of file
+        async with self._lock:
+            await self._init_store()
+            async with aiofiles.open(self.file_path, 'r+') as fh:
+                await fh.seek(0)
+                existing_data = json.loads(await fh.read())
+                await fh.seek(0)
+                await fh.truncate(0)
+                existing_data.update(sites_data)
+                await fh.write(json.dumps(existing_data))
+
+        return sites
+
+    async def get_metadata(self, *keys: str) -> Mapping[str, JSONType]:
+        async with self._lock:
+            await self._init_store()
+            async with aiofiles.open(self.file_path, 'r') as fh:
+                metadata = json.loads(await fh.read()).get(METADATA_KEY, {})
+
+        return {key: metadata[key] for key in keys if key in metadata}
+
+    async def put_metadata(self, values: Mapping[str, JSONType]) -> None:
+        async with self._lock:
+            await self._init_store()
+            async with aiofiles.open(self.file_path, 'r+') as fh:
+                existing_data = json.loads(await fh.read())
+                existing_data.setdefault(METADATA_KEY, {}).update(values)
+                await fh.seek(0)
+                await fh.truncate(0)
+                await fh.write(json.dumps(existing_data))
\ No newline at end of file
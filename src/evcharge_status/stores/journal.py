@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+from typing import Any, Generator, List, Mapping, MutableMapping, Optional
+
+import aiofiles
+
+from .base import StoreType
+from .file import JSONType, Store as FileStore
+from ..models import Site
+
+# Each line of the journal is a JSON record, either
+#
+#   {"site": "<guid>", "data": {...}}     the latest state of a site, as the file store formats it
+#   {"metadata": "<key>", "value": ...}   a metadata value
+#
+# Later records replace earlier ones for the same site or key. The journal is
+# replayed into memory on first use, so reads never touch the disk again. Once
+# the journal grows past ``compact_bytes``, and is at least ``compact_ratio``
+# times bigger than its live records, it is rewritten in the background with
+# just the latest record for each site and key.
+
+DEFAULT_COMPACT_BYTES = 4 * 1024 * 1024
+DEFAULT_COMPACT_RATIO = 2.0
+
+
+class Store(StoreType):
+
+    file_path: str
+    compact_bytes: int
+    compact_ratio: float
+    _sites: MutableMapping[str, JSONType]
+    _metadata: MutableMapping[str, JSONType]
+
+    def __init__(self, file_path: str, compact_bytes: Any=DEFAULT_COMPACT_BYTES,
+            compact_ratio: Any=DEFAULT_COMPACT_RATIO, fsync: Any=False):
+        self.file_path = file_path
+        # these may come from a query string
+        self.compact_bytes = int(compact_bytes)
+        self.compact_ratio = float(compact_ratio)
+        self.fsync = str(fsync).lower() in ('yes', '1', 'true', 'y', 'on')
+        self._loaded = False
+        self._sites = {}
+        self._metadata = {}
+        self._record_bytes = {}
+        self._live_bytes = 0
+        self._journal_bytes = 0
+        self._fh = None
+        self._lock = asyncio.Lock()
+        self._compaction: Optional[asyncio.Task] = None
+        self._compaction_tail: Optional[List[str]] = None
+
+    @staticmethod
+    def _record(line: str) -> Optional[Mapping[str, JSONType]]:
+        try:
+            return json.loads(line)
+        except ValueError:
+            # a torn write from a crash; everything before it is still good
+            return None
+
+    def _apply(self, record: Mapping[str, JSONType], size: int) -> None:
+        if 'site' in record:
+            key = ('site', record['site'])
+            self._sites[record['site']] = record['data']
+        elif 'metadata' in record:
+            key = ('metadata', record['metadata'])
+            self._metadata[record['metadata']] = record['value']
+        else:
+            return
+        # keep a running total of the size of the latest records, to know when to compact
+        self._live_bytes += size - self._record_bytes.get(key, 0)
+        self._record_bytes[key] = size
+
+    async def _load(self) -> None:
+        if self._loaded:
+            return
+
+        async with self._lock:
+            if self._loaded:
+                return
+
+            line = ''
+            async with aiofiles.open(self.file_path, 'a+') as fh:
+                await fh.seek(0)
+                async for line in fh:
+                    self._journal_bytes += len(line)
+                    record = self._record(line)
+                    if record is not None:
+                        self._apply(record, len(line))
+
+            if line and not line.endswith('\n'):
+                # don't let the next append run on from a torn line
+                async with aiofiles.open(self.file_path, 'a') as fh:
+                    await fh.write('\n')
+                self._journal_bytes += 1
+
+            self._loaded = True
+
+    def _records(self) -> Generator[Mapping[str, JSONType], None, None]:
+        for guid, data in self._sites.items():
+            yield {'site': guid, 'data': data}
+        for key, value in self._metadata.items():
+            yield {'metadata': key, 'value': value}
+
+    @staticmethod
+    def _line(record: Mapping[str, JSONType]) -> str:
+        return json.dumps(record, separators=(',', ':')) + '\n'
+
+    async def _append(self, records: List[Mapping[str, JSONType]]) -> None:
+        await self._load()
+        lines = [self._line(record) for record in records]
+        text = ''.join(lines)
+        async with self._lock:
+            if self._fh is None:
+                self._fh = await aiofiles.open(self.file_path, 'a')
+            await self._fh.write(text)
+            await self._fh.flush()
+            if self.fsync:
+                await asyncio.get_running_loop().run_in_executor(None, os.fsync, self._fh.fileno())
+            self._journal_bytes += len(text)
+            if self._compaction_tail is not None:
+                self._compaction_tail.append(text)
+            for record, line in zip(records, lines):
+                self._apply(record, len(line))
+
+        if self._should_compact():
+            self._compaction = asyncio.create_task(self.compact())
+
+    def _should_compact(self) -> bool:
+        if self._compaction is not None and not self._compaction.done():
+            return False
+        if self._journal_bytes < self.compact_bytes:
+            return False
+        return self._journal_bytes >= self._live_bytes * self.compact_ratio
+
+    async def compact(self) -> None:
+        """Rewrite the journal with only the latest record for each site and key.
+
+        Appends carry on while the snapshot is written, and are copied onto the
+        end of it before it replaces the journal.
+        """
+        await self._load()
+        snapshot = ''.join(self._line(record) for record in self._records())
+        self._compaction_tail = []
+        compact_path = f'{self.file_path}.compact'
+        try:
+            async with aiofiles.open(compact_path, 'w') as fh:
+                await fh.write(snapshot)
+            async with self._lock:
+                tail = ''.join(self._compaction_tail)
+                async with aiofiles.open(compact_path, 'a') as fh:
+                    await fh.write(tail)
+                    await fh.flush()
+                    await asyncio.get_running_loop().run_in_executor(None, os.fsync, fh.fileno())
+                if self._fh is not None:
+                    await self._fh.close()
+                    self._fh = None
+                os.replace(compact_path, self.file_path)
+                self._journal_bytes = len(snapshot) + len(tail)
+        finally:
+            self._compaction_tail = None
+
+    async def close(self) -> None:
+        if self._compaction is not None:
+            await self._compaction
+            self._compaction = None
+        if self._fh is not None:
+            await self._fh.close()
+            self._fh = None
+
+    async def get_sites(self, *site_guids: str) -> Generator[Site, None, None]:
+        await self._load()
+        if not site_guids:
+            site_guids = list(self._sites.keys())
+        for guid in site_guids:
+            if guid in self._sites:
+                yield FileStore.parse_site(self._sites[guid])
+
+    async def put_sites(self, *sites: Site) -> List[Site]:
+        await self._append([
+            {'site': site.guid, 'data': FileStore.format_site(site)}
+            for site in sites
+        ])
+        return sites
+
+    async def get_metadata(self, *keys: str) -> Mapping[str, JSONType]:
+        await self._load()
+        return {key: self._metadata[key] for key in keys if key in self._metadata}
+
+    async def put_metadata(self, values: Mapping[str, JSONType]) -> None:
+        await self._append([
+            {'metadata': key, 'value': value}
+            for key, value in values.items()
+        ])
@@ -0,0 +1,221 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import json
+import sqlite3
+import time
+from typing import Any, Generator, List, Mapping, MutableMapping, Optional, Sequence, Tuple
+
+from .base import StoreType
+from ..models import ConnectorType, Point, Site, State
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sites (
+    guid TEXT PRIMARY KEY,
+    name TEXT,
+    address TEXT,
+    town TEXT,
+    county TEXT,
+    postcode TEXT,
+    country TEXT,
+    lat TEXT,
+    lng TEXT,
+    last_changed REAL
+);
+CREATE TABLE IF NOT EXISTS points (
+    guid TEXT PRIMARY KEY,
+    site_guid TEXT NOT NULL REFERENCES sites (guid) ON DELETE CASCADE,
+    point_id TEXT,
+    state TEXT,
+    price TEXT,
+    max_power REAL,
+    connector_type TEXT,
+    image_url TEXT,
+    last_changed REAL
+);
+CREATE INDEX IF NOT EXISTS points_site_guid ON points (site_guid);
+CREATE INDEX IF NOT EXISTS points_state_connector_type ON points (state, connector_type);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+SITE_COLUMNS = ('guid', 'name', 'address', 'town', 'county', 'postcode', 'country', 'lat', 'lng')
+POINT_COLUMNS = ('guid', 'site_guid', 'point_id', 'state', 'price', 'max_power', 'connector_type', 'image_url')
+
+
+def _upsert(table: str, columns: Sequence[str]) -> str:
+    """An upsert which leaves the row alone unless a value actually changed."""
+    values = ', '.join('?' for _ in columns)
+    updates = ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+    changed = ' OR '.join(f'{column} IS NOT excluded.{column}' for column in columns[1:])
+    return (
+        f'INSERT INTO {table} ({", ".join(columns)}, last_changed) VALUES ({values}, ?) '
+        f'ON CONFLICT ({columns[0]}) DO UPDATE SET {updates}, last_changed = excluded.last_changed '
+        f'WHERE {changed}'
+    )
+
+
+UPSERT_SITE = _upsert('sites', SITE_COLUMNS)
+UPSERT_POINT = _upsert('points', POINT_COLUMNS)
+
+# stay well below SQLite's limit on the number of bound parameters
+MAX_PARAMETERS = 500
+
+
+def _chunks(items: Sequence[Any], size: int=MAX_PARAMETERS) -> Generator[Sequence[Any], None, None]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class Store(StoreType):
+
+    file_path: str
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        # SQLite connections belong to one thread, so all queries go through one worker
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-store')
+        self._connection: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.file_path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.execute('PRAGMA foreign_keys = ON')
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    @classmethod
+    def point_row(cls, site_guid: str, point: Point) -> Tuple:
+        return (
+            point.guid,
+            site_guid,
+            point.point_id,
+            point.state.value,
+            str(point.price),
+            point.max_power,
+            point.connector_type.value,
+            point.image_url,
+        )
+
+    @classmethod
+    def site_row(cls, site: Site) -> Tuple:
+        return tuple(getattr(site, column) for column in SITE_COLUMNS)
+
+    @classmethod
+    def parse_point(cls, row: Sequence[Any]) -> Point:
+        guid, _, point_id, state_text, price, max_power, connector_type_text, image_url = row
+        try:
+            state = State(state_text)
+        except ValueError:
+            state = State.UNKNOWN
+        try:
+            connector_type = ConnectorType(connector_type_text)
+        except ValueError:
+            connector_type = ConnectorType.UNKNOWN
+        return Point(guid, point_id, state, Decimal(price or '0'), max_power, connector_type, image_url)
+
+    def _get_sites(self, *site_guids: str) -> List[Site]:
+        connection = self.connection
+        site_columns = ', '.join(SITE_COLUMNS)
+        point_columns = ', '.join(POINT_COLUMNS)
+        if site_guids:
+            site_rows = []
+            point_rows = []
+            for chunk in _chunks(site_guids):
+                placeholders = ', '.join('?' for _ in chunk)
+                site_rows.extend(connection.execute(
+                    f'SELECT {site_columns} FROM sites WHERE guid IN ({placeholders})', chunk))
+                point_rows.extend(connection.execute(
+                    f'SELECT {point_columns} FROM points WHERE site_guid IN ({placeholders})', chunk))
+        else:
+            site_rows = connection.execute(f'SELECT {site_columns} FROM sites').fetchall()
+            point_rows = connection.execute(f'SELECT {point_columns} FROM points').fetchall()
+
+        points: MutableMapping[str, MutableMapping[str, Point]] = {}
+        for row in point_rows:
+            points.setdefault(row[1], {})[row[0]] = self.parse_point(row)
+
+        return [Site(*row, points=points.get(row[0], {})) for row in site_rows]
+
+    async def get_sites(self, *site_guids: str) -> Generator[Site, None, None]:
+        for site in await self._run(self._get_sites, *site_guids):
+            yield site
+
+    def _put_sites(self, *sites: Site) -> List[Site]:
+        now = time.time()
+        with self.connection as connection:
+            connection.executemany(UPSERT_SITE, [self.site_row(site) + (now,) for site in sites])
+            connection.executemany(UPSERT_POINT, [
+                self.point_row(site.guid, point) + (now,)
+                for site in sites
+                for point in site.points.values()
+            ])
+            for site in sites:
+                # points which have gone from the site
+                guids = list(site.points.keys())
+                placeholders = ', '.join('?' for _ in guids)
+                connection.execute(
+                    f'DELETE FROM points WHERE site_guid = ? AND guid NOT IN ({placeholders})',
+                    [site.guid, *guids])
+        return list(sites)
+
+    async def put_sites(self, *sites: Site) -> List[Site]:
+        return await self._run(self._put_sites, *sites)
+
+    def _find_points(self, state: Optional[State], connector_type: Optional[ConnectorType]) -> List[Tuple[str, Point]]:
+        conditions = []
+        params = []
+        if state is not None:
+            conditions.append('state = ?')
+            params.append(state.value)
+        if connector_type is not None:
+            conditions.append('connector_type = ?')
+            params.append(connector_type.value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self.connection.execute(f'SELECT {", ".join(POINT_COLUMNS)} FROM points {where}', params)
+        return [(row[1], self.parse_point(row)) for row in rows]
+
+    async def find_points(self, state: Optional[State]=None,
+            connector_type: Optional[ConnectorType]=None) -> List[Tuple[str, Point]]:
+        """Find points by state and/or connector type, e.g. all available CCS
+        points. Returns (site GUID, point) pairs."""
+        return await self._run(self._find_points, state, connector_type)
+
+    def _get_metadata(self, *keys: str) -> Mapping[str, Any]:
+        values = {}
+        for chunk in _chunks(keys):
+            placeholders = ', '.join('?' for _ in chunk)
+            for key, value in self.connection.execute(
+                    f'SELECT key, value FROM metadata WHERE key IN ({placeholders})', chunk):
+                values[key] = json.loads(value)
+        return values
+
+    async def get_metadata(self, *keys: str) -> Mapping[str, Any]:
+        return await self._run(self._get_metadata, *keys)
+
+    def _put_metadata(self, values: Mapping[str, Any]) -> None:
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT INTO metadata (key, value) VALUES (?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+                [(key, json.dumps(value)) for key, value in values.items()])
+
+    async def put_metadata(self, values: Mapping[str, Any]) -> None:
+        await self._run(self._put_metadata, values)
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def close(self) -> None:
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
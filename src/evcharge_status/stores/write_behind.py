@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Any, Generator, List, Mapping, MutableMapping, Optional
+
+from .base import StoreType
+from ..models import Site
+
+
+DEFAULT_INTERVAL = 30.0
+DEFAULT_MAX_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindStore(StoreType):
+    """Wraps any store, holding the latest version of each site put to it and
+    writing them out in one batch every ``interval`` seconds, or once
+    ``max_size`` sites are waiting. Repeated puts of a site in between are
+    collapsed into one write.
+    """
+
+    store: StoreType
+    interval: float
+    max_size: int
+    _dirty: MutableMapping[str, Site]
+
+    def __init__(self, store: StoreType, interval: float=DEFAULT_INTERVAL, max_size: int=DEFAULT_MAX_SIZE):
+        self.store = store
+        self.interval = interval
+        self.max_size = max_size
+        self._dirty = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        try:
+            await self.flush()
+        except Exception:
+            # nobody is waiting on this task, so the failed batch is still
+            # queued, and has to be tried again without another put
+            logger.exception('Failed to write %d buffered sites, retrying in %ss', len(self._dirty), self.interval)
+            if self._dirty and self._timer is None:
+                self._timer = asyncio.create_task(self._flush_later())
+
+    async def put_sites(self, *sites: Site) -> List[Site]:
+        for site in sites:
+            self._dirty[site.guid] = site
+
+        if len(self._dirty) >= self.max_size:
+            await self.flush()
+        elif self._dirty and self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        return list(sites)
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            if self._timer is not asyncio.current_task():
+                self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            if not self._dirty:
+                return
+
+            sites = self._dirty
+            self._dirty = {}
+            try:
+                await self.store.put_sites(*sites.values())
+            except Exception:
+                # put them back, unless a newer version has arrived since
+                for guid, site in sites.items():
+                    self._dirty.setdefault(guid, site)
+                raise
+
+    async def get_sites(self, *site_guids: str) -> Generator[Site, None, None]:
+        if not site_guids:
+            await self.flush()
+            async for site in self.store.get_sites():
+                yield site
+            return
+
+        for guid in site_guids:
+            if guid in self._dirty:
+                yield self._dirty[guid]
+
+        remaining = [guid for guid in site_guids if guid not in self._dirty]
+        if remaining:
+            async for site in self.store.get_sites(*remaining):
+                yield site
+
+    async def get_metadata(self, *keys: str) -> Mapping[str, Any]:
+        return await self.store.get_metadata(*keys)
+
+    async def put_metadata(self, values: Mapping[str, Any]) -> None:
+        await self.store.put_metadata(values)
+
+    async def close(self) -> None:
+        await self.flush()
+        await self.store.close()
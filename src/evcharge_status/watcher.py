@@ -1,25 +1,37 @@
 import asyncio
+import logging
 import threading
-from typing import Iterable, MutableMapping
+from typing import Iterable, MutableMapping, Optional
+
+import aiohttp
 
 from .models import Site, SiteDiff
 from .notifications import NotifierType
+from .resilience import CircuitOpenError
+from .scheduler import Scheduler
 from .stores import StoreType
 
 
+logger = logging.getLogger(__name__)
+
 
 class Watcher:
 
     period: float
+    concurrency: int
     notifier: NotifierType
+    scheduler: Optional[Scheduler]
     store: StoreType
     _exit_semaphore: threading.Semaphore
     _sites_memory_store: MutableMapping[str, Site]
 
-    def __init__(self, sites: Iterable[Site], period: float, store: StoreType, notifier: NotifierType):
+    def __init__(self, sites: Iterable[Site], period: float, store: StoreType, notifier: NotifierType, concurrency: int=1,
+            scheduler: Optional[Scheduler]=None):
         self.period = period
+        self.concurrency = max(1, concurrency)
         self.store = store
         self.notifier = notifier
+        self.scheduler = scheduler
         self._exit_semaphore = threading.Semaphore(0)
         self._sites_memory_store = {
             site.guid: site for site in sites
@@ -40,26 +52,77 @@ class Watcher:
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        pass
+        # don't lose anything the store is holding back
+        await self.store.flush()
 
     def stop(self):
         self._exit_semaphore.release()
         if self.__sleep_task:
             self.__sleep_task.cancel()
 
+    async def _refresh_site(self, site: Site, semaphore: asyncio.Semaphore) -> Optional[SiteDiff]:
+        async with semaphore:
+            old_site = site.copy()
+            try:
+                await site.refresh_points()
+            except (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError):
+                # upstream is struggling; keep serving the last known state
+                return None
+
+        diff = SiteDiff.from_sites(old_site, site)
+        if diff:
+            # notify as soon as this site is done, rather than waiting for the rest of the cycle
+            await self.notifier.notify_changes(diff)
+            return diff
+
+        return None
+
     async def run(self):
+        if self.scheduler is not None:
+            return await self._run_scheduled()
+
         while not self._exit_semaphore.acquire(blocking=False):
             awaitables = []
+            semaphore = asyncio.Semaphore(self.concurrency)
+            diffs = await asyncio.gather(*[
+                self._refresh_site(site, semaphore)
+                for site in self._sites_memory_store.values()
+            ])
+            updated_sites: MutableMapping[str, Site] = {
+                diff.guid: diff.new for diff in diffs if diff
+            }
+
+            if updated_sites:
+                awaitables.append(self.store.put_sites(*updated_sites.values()))
+
+            await asyncio.gather(self._sleep(self.period), *awaitables)
+
+    async def _run_scheduled(self):
+        while not self._exit_semaphore.acquire(blocking=False):
+            awaitables = []
+            semaphore = asyncio.Semaphore(self.concurrency)
+            # before popping, so the most overdue site is still queued
+            queue_depth, lag = self.scheduler.queue_depth, self.scheduler.lag
+            if lag > self.scheduler.min_period:
+                logger.warning('Polling is %.1fs behind schedule, %d sites queued', lag, queue_depth)
+            else:
+                logger.debug('Polling is %.1fs behind schedule, %d sites queued', lag, queue_depth)
+            due_sites = [
+                self._sites_memory_store[guid]
+                for guid in self.scheduler.pop_due()
+                if guid in self._sites_memory_store
+            ]
+            diffs = await asyncio.gather(*[
+                self._refresh_site(site, semaphore)
+                for site in due_sites
+            ])
             updated_sites: MutableMapping[str, Site] = {}
-            for guid, site in self._sites_memory_store.items():
-                old_site = site.copy()
-                await site.refresh_points()
-                diff = SiteDiff.from_sites(old_site, site)
+            for site, diff in zip(due_sites, diffs):
+                self.scheduler.reschedule(site, diff)
                 if diff:
-                    updated_sites[guid] = site
-                    awaitables.append(self.notifier.notify_changes(diff))
+                    updated_sites[site.guid] = site
 
             if updated_sites:
                 awaitables.append(self.store.put_sites(*updated_sites.values()))
 
-            await asyncio.gather(self._sleep(self.period), *awaitables)
\ No newline at end of file
+            await asyncio.gather(self._sleep(self.scheduler.time_until_next()), *awaitables)
@@ -18,17 +18,20 @@ setup(
     version=version,
     author="Richard Mitchell",
     url="https://github.com/mitchellrj/evcharge-online-status",
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     zip_safe=False,
     install_requires=requirements,
     entry_points={
         "console_scripts": [
             "evcharge-status=evcharge_status.cli:main",
-            "evcharge-status-update-to-slack=evcharge_status.slack:status"
+            "evcharge-status-lambda=evcharge_status.aws_lambda:main",
+            "evcharge-status-analytics=evcharge_status.analytics:main"
         ]
     },
     extras_require={
-        "DynamoDB": ["boto3"]
+        "DynamoDB": ["boto3"],
+        "lxml": ["lxml"],
+        "analytics": ["numpy"],
     }
 )
\ No newline at end of file
@@ -0,0 +1,305 @@
+"""The DynamoDB store, against moto's stand-in for DynamoDB."""
+import asyncio
+from decimal import Decimal
+import threading
+
+import pytest
+
+from evcharge_status.models import SITE_ATTRIBUTES, ConnectorType, Point, Site, SiteDiff, State
+from evcharge_status.parsers.base import point_key
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+from evcharge_status.stores import dynamodb  # noqa: E402
+
+
+TABLE_NAME = 'sites'
+REGION = 'eu-west-2'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    for name, value in {
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+            'AWS_SESSION_TOKEN': 'testing',
+            'AWS_DEFAULT_REGION': REGION}.items():
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        boto3.client('dynamodb', region_name=REGION).create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'site_guid', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'site_guid', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        yield
+
+
+@pytest.fixture
+def no_backoff_delay(monkeypatch):
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(dynamodb.asyncio, 'sleep', sleep)
+    return delays
+
+
+def make_site(i, state=State.AVAILABLE):
+    guid = f'SITE{i:04}'
+    points = {
+        f'{guid}-P{j}': Point(
+            f'{guid}-P{j}', f'UKEV{i}{j}', state, Decimal('0.45'), 50.0, ConnectorType.CCS,
+            'https://evcharge.online/Content/images/connectors/ccs.png')
+        for j in range(2)
+    }
+    return Site(guid, f'Site {i}', '1 High Street', 'Banbury', 'Oxfordshire', 'OX16 2PA',
+        'United Kingdom', '52.06290', '-1.33978', points)
+
+
+def assert_stored(stored, site):
+    assert not SiteDiff.from_sites(stored, site)
+    assert [getattr(stored, attr) for attr in SITE_ATTRIBUTES] == [getattr(site, attr) for attr in SITE_ATTRIBUTES]
+    assert {guid: point_key(point) for guid, point in stored.points.items()} == \
+        {guid: point_key(point) for guid, point in site.points.items()}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def collect(store, guids):
+    return [site async for site in store.get_sites(*guids)]
+
+
+def count_calls(monkeypatch, store, name, replace=None):
+    calls = []
+    original = getattr(store.client, name)
+
+    def wrapper(**kwargs):
+        calls.append(kwargs)
+        if replace is not None:
+            return replace(original, **kwargs)
+        return original(**kwargs)
+
+    monkeypatch.setattr(store.client, name, wrapper)
+    return calls
+
+
+def test_round_trip(aws):
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        sites = [make_site(i) for i in range(3)]
+        await store.put_sites(*sites)
+        stored = {site.guid: site for site in await collect(store, [site.guid for site in sites])}
+        await store.close()
+        return sites, stored
+
+    sites, stored = run(main())
+    assert stored.keys() == {site.guid for site in sites}
+    for site in sites:
+        assert_stored(stored[site.guid], site)
+
+
+def test_get_all_sites_scans(aws, monkeypatch):
+    sites = [make_site(i) for i in range(5)]
+
+    def small_pages(original, **kwargs):
+        return original(Limit=2, **kwargs)
+
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        await store.put_sites(*sites)
+        await store.put_metadata({'key': 'value'})
+        calls = count_calls(monkeypatch, store, 'scan', small_pages)
+        stored = {site.guid: site async for site in store.get_sites()}
+        await store.close()
+        return stored, calls
+
+    stored, calls = run(main())
+    # paginated, and metadata items left out
+    assert len(calls) > 1
+    assert stored.keys() == {site.guid for site in sites}
+    for site in sites:
+        assert_stored(stored[site.guid], site)
+
+
+def test_unchanged_writes_skipped_and_reported(aws, caplog):
+    sites = [make_site(i) for i in range(3)]
+
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        await store.put_sites(*sites)
+        await store.put_sites(*sites)
+        with caplog.at_level('INFO', logger=dynamodb.__name__):
+            await store.close()
+        return store
+
+    store = run(main())
+    assert store.full_writes == len(sites)
+    assert store.writes_skipped == len(sites)
+    assert store.write_units_saved >= len(sites)
+    assert f'{len(sites)} unchanged sites skipped' in caplog.text
+    assert f'~{store.write_units_saved} write units saved' in caplog.text
+
+
+def test_changed_points_partly_updated(aws, monkeypatch):
+    site = make_site(0)
+    site._points = {
+        f'P{j}': Point(f'P{j}', f'UKEV{j}', State.AVAILABLE, Decimal('0.45'), 50.0, ConnectorType.CCS, None)
+        for j in range(8)
+    }
+    points = dict(site.points)
+    # one changed, one removed, one added
+    points['P0'] = Point('P0', 'UKEV0', State.CHARGING, Decimal('0.45'), 50.0, ConnectorType.CCS, None)
+    del points['P1']
+    points['P8'] = Point('P8', 'UKEV8', State.OFFLINE, Decimal('0.30'), 22.0, ConnectorType.TYPE_2,
+        'https://evcharge.online/Content/images/connectors/type_2.png')
+    changed = site.copy()
+    changed._points = points
+
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        await store.put_sites(site)
+        updates = count_calls(monkeypatch, store, 'update_item')
+        writes = count_calls(monkeypatch, store, 'batch_write_item')
+        await store.put_sites(changed)
+        stored = await collect(store, [site.guid])
+        # the stored fingerprints were updated too
+        await store.put_sites(changed)
+        await store.close()
+        return store, updates, writes, stored
+
+    store, updates, writes, stored = run(main())
+    assert len(updates) == 1
+    assert not writes
+    assert store.partial_updates == 1
+    assert store.full_writes == 1
+    assert store.writes_skipped == 1
+    assert len(stored) == 1
+    assert_stored(stored[0], changed)
+
+
+def test_batch_get_streams_pages(aws, monkeypatch):
+    # more than fit in one BatchGetItem request
+    sites = [make_site(i) for i in range(dynamodb.MAX_BATCH_GET_KEYS + 20)]
+    guids = [site.guid for site in sites]
+
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        await store.put_sites(*sites)
+        calls = count_calls(monkeypatch, store, 'batch_get_item')
+
+        results = store.get_sites(*guids)
+        first = await results.__anext__()
+        calls_before_first = len(calls)
+        rest = [site async for site in results]
+        await store.close()
+        return first, rest, calls_before_first, calls
+
+    first, rest, calls_before_first, calls = run(main())
+    # the first site arrives before the second page is requested
+    assert calls_before_first == 1
+    assert len(calls) == 2
+    assert sorted(site.guid for site in [first, *rest]) == sorted(guids)
+
+
+def test_unprocessed_keys_are_retried_with_backoff(aws, monkeypatch, no_backoff_delay):
+    sites = [make_site(i) for i in range(5)]
+    guids = [site.guid for site in sites]
+
+    def partial(original, RequestItems):
+        # only process the first key of each request, as if throttled
+        keys = RequestItems[TABLE_NAME]['Keys']
+        response = original(RequestItems={TABLE_NAME: dict(RequestItems[TABLE_NAME], Keys=keys[:1])})
+        if len(keys) > 1:
+            response['UnprocessedKeys'] = {TABLE_NAME: dict(RequestItems[TABLE_NAME], Keys=keys[1:])}
+        return response
+
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        await store.put_sites(*sites)
+        calls = count_calls(monkeypatch, store, 'batch_get_item', partial)
+        found = await collect(store, guids)
+        await store.close()
+        return found, calls
+
+    found, calls = run(main())
+    assert sorted(site.guid for site in found) == sorted(guids)
+    assert len(calls) == len(guids)
+    # one backoff before each retry, growing exponentially up to the cap
+    assert len(no_backoff_delay) == len(guids) - 1
+    for attempt, delay in enumerate(no_backoff_delay):
+        assert 0 <= delay <= min(dynamodb.UNPROCESSED_MAX_DELAY, dynamodb.UNPROCESSED_BASE_DELAY * 2 ** attempt)
+
+
+def test_unprocessed_keys_give_up(aws, monkeypatch, no_backoff_delay):
+    site = make_site(0)
+
+    def never(original, RequestItems):
+        return {'Responses': {TABLE_NAME: []}, 'UnprocessedKeys': RequestItems}
+
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        await store.put_sites(site)
+        count_calls(monkeypatch, store, 'batch_get_item', never)
+        try:
+            await collect(store, [site.guid])
+        finally:
+            await store.close()
+
+    with pytest.raises(RuntimeError):
+        run(main())
+    assert len(no_backoff_delay) == dynamodb.UNPROCESSED_MAX_ATTEMPTS
+
+
+def test_client_reused(aws, monkeypatch):
+    clients = []
+    real_client = boto3.client
+
+    def client(*args, **kwargs):
+        clients.append(real_client(*args, **kwargs))
+        return clients[-1]
+
+    monkeypatch.setattr(boto3, 'client', client)
+    sites = [make_site(i) for i in range(3)]
+
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        for state in (State.AVAILABLE, State.CHARGING):
+            await store.put_sites(*[make_site(i, state) for i in range(3)])
+            await collect(store, [site.guid for site in sites])
+            await store.put_metadata({'key': 'value'})
+            assert await store.get_metadata('key') == {'key': 'value'}
+        await store.close()
+
+    run(main())
+    assert len(clients) == 1
+
+
+def test_close_does_not_block_loop(aws):
+    async def main():
+        store = dynamodb.Store(TABLE_NAME, REGION)
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        finish = threading.Event()
+
+        def busy():
+            loop.call_soon_threadsafe(started.set)
+            finish.wait(5)
+
+        # keep one of the store's threads busy while closing
+        pending = asyncio.ensure_future(store._run(busy))
+        await started.wait()
+        closing = asyncio.ensure_future(store.close())
+        await asyncio.sleep(0.01)
+        # the loop kept running while close waited for the thread
+        assert not closing.done()
+        finish.set()
+        await asyncio.gather(pending, closing)
+
+    run(main())
@@ -0,0 +1,44 @@
+"""Parser backends must agree over saved nologinpoints pages."""
+import glob
+import os
+
+import pytest
+
+from evcharge_status.models import Site, SiteDiff
+from evcharge_status.parsers import get_parser
+from evcharge_status.parsers.base import point_key
+
+pytest.importorskip('lxml')
+
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'benchmarks', 'recorded')
+PAGES = sorted(glob.glob(os.path.join(PAGES_DIR, 'nologinpoints_*.html')))
+BASE_URL = 'https://evcharge.online/nologinpoints/'
+
+
+def read(path):
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+def make_site(points):
+    return Site(
+        'SITE', 'Banbury Rapid Hub', 'Castle Quay', 'Banbury', 'Oxfordshire', 'OX16 2PA',
+        'United Kingdom', '52.06290', '-1.33978', points,
+    )
+
+
+def test_pages_saved():
+    assert PAGES
+
+
+@pytest.mark.parametrize('path', PAGES, ids=os.path.basename)
+def test_backends_agree(path):
+    content = read(path)
+    expected = get_parser('bs4')(content, BASE_URL)
+    actual = get_parser('lxml')(content, BASE_URL)
+
+    assert list(actual) == list(expected)
+    assert {guid: point_key(point) for guid, point in actual.items()} == \
+        {guid: point_key(point) for guid, point in expected.items()}
+    assert not SiteDiff.from_sites(make_site(expected), make_site(actual))